@@ -0,0 +1,259 @@
+"""
+Benchmarks every layer of the balance engine on the bundled test cases and on synthetic horizons, and writes a JSON
+report that can be diffed against a previous run.
+
+Run from the repository root:
+    python -m benchmarks.bench_engine [--output report.json] [--repeat N] [--cases ct5.1 synthetic_7d ...]
+                                      [--no-imports]
+    python -m benchmarks.bench_engine --compare baseline.json report.json [--threshold 0.1]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pydantic
+
+from utils._test_case_generator import generate_test_case
+from utils.model_generator import pig_iron_balance_model
+
+SYNTHETIC_HORIZONS = (1, 7, 30, 90)
+SYNTHETIC_SEED = 42
+LAYERS = ('pig_iron_balance_model', 'generate_pig_iron_balance', 'create_virtual_plateaus', 'optimize_hmr')
+# Cold import time, each in a fresh interpreter; the engine must not pull any of HEAVY_PACKAGES in
+IMPORTS = ('model.pig_iron_balance', 'utils.model_generator', 'utils.columnar_loader', 'utils.plot_interface')
+HEAVY_PACKAGES = ('scipy', 'pandas', 'plotly', 'sympy', 'PIL', 'kaleido', 'colorlover')
+IMPORT_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(sorted({{name.split('.')[0] for name in sys.modules}} & set({heavy!r}))))
+'''
+
+
+def load_cases(test_cases_dir: str = 'test_cases', horizons=SYNTHETIC_HORIZONS) -> Dict[str, dict]:
+    cases = {}
+    for filename in sorted(os.listdir(test_cases_dir)):
+        if filename.endswith('.json'):
+            with open(os.path.join(test_cases_dir, filename)) as json_file:
+                cases[filename.split('.json')[0]] = json.load(json_file)
+    for days in horizons:
+        cases[f'synthetic_{days}d'] = generate_test_case(f'synthetic_{days}d', days=days, seed=SYNTHETIC_SEED,
+                                                         save=False)
+    return cases
+
+
+def layer_runs(input_data: dict) -> Dict[str, Tuple[Callable, Callable]]:
+    """
+    Returns:
+        per layer, a setup building what the layer needs (not timed) and the timed call, which returns the
+        iteration count when the layer has one
+    """
+
+    def model():
+        return pig_iron_balance_model(input_data)
+
+    def simulated():
+        pig_iron_balance = model()
+        pig_iron_balance.generate_pig_iron_balance()
+        return pig_iron_balance
+
+    def build(_):
+        model()
+
+    def simulate(pig_iron_balance):
+        pig_iron_balance.generate_pig_iron_balance()
+
+    def discover_plateaus(pig_iron_balance):
+        list(pig_iron_balance.create_virtual_plateaus())
+
+    def optimize(pig_iron_balance):
+        # cases without the optimize_hmr flag (ct1, ct2.x) would otherwise time a bare simulation
+        pig_iron_balance.optimize = True
+        report = pig_iron_balance.optimize_hmr()
+        return report.iterations if report is not None else 0
+
+    return {
+        'pig_iron_balance_model': (lambda: None, build),
+        'generate_pig_iron_balance': (model, simulate),
+        'create_virtual_plateaus': (simulated, discover_plateaus),
+        'optimize_hmr': (model, optimize),
+    }
+
+
+def measure(setup: Callable, run: Callable, repeat: int) -> dict:
+    timings = []
+    iterations = None
+    for _ in range(repeat):
+        subject = setup()
+        start = time.perf_counter()
+        iterations = run(subject)
+        timings.append(time.perf_counter() - start)
+
+    # peak memory is taken on a separate run, tracemalloc slows the allocations down
+    subject = setup()
+    tracemalloc.start()
+    run(subject)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'best_s': min(timings),
+        'median_s': statistics.median(timings),
+        'repeat': repeat,
+        'iterations': iterations,
+        'peak_memory_bytes': peak,
+    }
+
+
+def measure_import(module: str, repeat: int) -> dict:
+    timings = []
+    heavy = ''
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT.format(module=module, heavy=HEAVY_PACKAGES)],
+                                capture_output=True, text=True, check=True).stdout.split()
+        timings.append(float(output[0]))
+        heavy = output[1] if len(output) > 1 else ''
+    return {
+        'module': module,
+        'best_s': min(timings),
+        'median_s': statistics.median(timings),
+        'repeat': repeat,
+        'heavy_packages': heavy.split(',') if heavy else [],
+    }
+
+
+def run_import_benchmarks(modules=IMPORTS, repeat: int = 3) -> List[dict]:
+    results = []
+    for module in modules:
+        result = measure_import(module, repeat)
+        results.append(result)
+        print(f'{"import":<14}{module:<35}{result["best_s"] * 1e3:>12.2f}ms  {",".join(result["heavy_packages"])}',
+              file=sys.stderr)
+    return results
+
+
+def run_benchmarks(cases: Dict[str, dict], layers=LAYERS, repeat: int = 3, imports=IMPORTS) -> dict:
+    results = []
+    for ct_name, input_data in cases.items():
+        runs = layer_runs(input_data)
+        n_converters = len(input_data['converter_1']) + len(input_data['converter_2'])
+        for layer in layers:
+            setup, run = runs[layer]
+            result = {'case': ct_name, 'layer': layer, 'n_converters': n_converters, **measure(setup, run, repeat)}
+            results.append(result)
+            print(f'{ct_name:<14}{layer:<28}{n_converters:>7}{result["best_s"] * 1e3:>12.2f}ms'
+                  f'{result["peak_memory_bytes"] / 2 ** 20:>10.2f}MiB', file=sys.stderr)
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pydantic': pydantic.VERSION,
+        },
+        'results': results,
+        'imports': run_import_benchmarks(imports, repeat),
+    }
+
+
+def compare_reports(baseline: dict, current: dict, threshold: float = 0.1) -> List[dict]:
+    """
+    Args:
+        baseline: report of the reference run
+        current: report of the run under test
+        threshold: relative slowdown (on the best time) reported as a regression
+
+    Returns:
+        one row per (case, layer) and per imported module present in both reports
+    """
+    reference = {(result['case'], result['layer']): result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        before = reference.get((result['case'], result['layer']))
+        if before is None:
+            continue
+        ratio = result['best_s'] / before['best_s'] if before['best_s'] else float('inf')
+        rows.append({
+            'case': result['case'],
+            'layer': result['layer'],
+            'before_s': before['best_s'],
+            'after_s': result['best_s'],
+            'ratio': ratio,
+            'memory_ratio': result['peak_memory_bytes'] / max(before['peak_memory_bytes'], 1),
+            'iterations_changed': result['iterations'] != before['iterations'],
+            'regression': ratio > 1 + threshold,
+        })
+    reference = {result['module']: result for result in baseline.get('imports', [])}
+    for result in current.get('imports', []):
+        before = reference.get(result['module'])
+        if before is None:
+            continue
+        ratio = result['best_s'] / before['best_s'] if before['best_s'] else float('inf')
+        rows.append({
+            'case': 'import',
+            'layer': result['module'],
+            'before_s': before['best_s'],
+            'after_s': result['best_s'],
+            'ratio': ratio,
+            'memory_ratio': 1.0,
+            'iterations_changed': False,
+            # a newly pulled heavy package counts as a regression whatever the timing noise
+            'regression': ratio > 1 + threshold or bool(set(result['heavy_packages']) -
+                                                        set(before['heavy_packages'])),
+        })
+    return rows
+
+
+def print_comparison(rows: List[dict]):
+    print(f'{"case":<14}{"layer":<28}{"before":>12}{"after":>12}{"ratio":>8}{"memory":>8}')
+    for row in rows:
+        flag = ' REGRESSION' if row['regression'] else ''
+        if row['iterations_changed']:
+            flag += ' ITERATIONS'
+        print(f'{row["case"]:<14}{row["layer"]:<28}{row["before_s"] * 1e3:>10.2f}ms{row["after_s"] * 1e3:>10.2f}ms'
+              f'{row["ratio"]:>7.2f}x{row["memory_ratio"]:>7.2f}x{flag}')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', default=None, help='report file, printed to stdout when omitted')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--cases', nargs='*', default=None, help='case names, every case when omitted')
+    parser.add_argument('--layers', nargs='*', default=list(LAYERS), choices=LAYERS)
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), default=None)
+    parser.add_argument('--threshold', type=float, default=0.1)
+    parser.add_argument('--no-imports', action='store_true', help='skips the import time measurements')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path) as report_file:
+                reports.append(json.load(report_file))
+        rows = compare_reports(*reports, threshold=args.threshold)
+        print_comparison(rows)
+        return int(any(row['regression'] for row in rows))
+
+    cases = load_cases()
+    if args.cases is not None:
+        cases = {name: cases[name] for name in args.cases}
+    report = run_benchmarks(cases, args.layers, args.repeat, () if args.no_imports else IMPORTS)
+    if args.output is None:
+        print(json.dumps(report, indent=4))
+    else:
+        with open(args.output, 'w') as report_file:
+            json.dump(report, report_file, indent=4)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Per-instance construction cost of the pydantic models, validated vs ``construct``.
+
+Run from the repository root:
+    python -m benchmarks.bench_model_construction [test_case]
+"""
+import json
+import sys
+import timeit
+from datetime import datetime
+
+from model.pig_iron_balance import Converter, ConverterInPlateau, PigIronBalanceState, PigIronTippingEvent
+from utils.model_generator import pig_iron_balance_model
+
+
+def per_instance_us(build, items, repeat=5):
+    best = min(timeit.repeat(lambda: [build(item) for item in items], number=1, repeat=repeat))
+    return best / len(items) * 1e6
+
+
+def construction_cases(input_data):
+    raw_converters = input_data["converter_1"] + input_data["converter_2"]
+    pig_iron_balance = pig_iron_balance_model(input_data)
+    pig_iron_balance.generate_pig_iron_balance()
+    states = [(state.time, state.value) for state in pig_iron_balance.pig_iron_balance]
+    spills = [spill.time for spill in pig_iron_balance.spill_events] or [state[0] for state in states]
+    plateau_fields = [
+        dict(cv=cv.cv, index=cv.index, time=cv.time, hmr=cv.hmr, hmr_min=pig_iron_balance.min_hmr,
+             hmr_max=pig_iron_balance.max_hmr, post_converter_state=pig_iron_balance.get_post_converter_state(cv),
+             pig_iron_restrictive_min=pig_iron_balance.min_restrictive, k=pig_iron_balance.k)
+        for cv in pig_iron_balance.converters
+    ]
+    return {
+        'Converter (from JSON)': (
+            lambda data: Converter(**data),
+            lambda data: Converter.construct(**{**data, 'time': datetime.fromisoformat(data['time'])}),
+            raw_converters,
+        ),
+        'PigIronBalanceState': (
+            lambda state: PigIronBalanceState(time=state[0], value=state[1]),
+            lambda state: PigIronBalanceState.construct(time=state[0], value=state[1]),
+            states,
+        ),
+        'PigIronTippingEvent': (
+            lambda time: PigIronTippingEvent(time=time),
+            lambda time: PigIronTippingEvent.construct(time=time),
+            spills,
+        ),
+        'ConverterInPlateau': (
+            lambda fields: ConverterInPlateau(**fields),
+            lambda fields: ConverterInPlateau.construct(**fields),
+            plateau_fields,
+        ),
+    }
+
+
+def run(test_case='ct8.1'):
+    with open(f'test_cases/{test_case}.json') as json_file:
+        input_data = json.load(json_file)
+
+    print(f'{test_case}: per-instance cost [us]')
+    print(f'{"model":<24}{"validated":>12}{"construct":>12}{"speedup":>10}')
+    for name, (validated, constructed, items) in construction_cases(input_data).items():
+        before = per_instance_us(validated, items)
+        after = per_instance_us(constructed, items)
+        print(f'{name:<24}{before:>12.2f}{after:>12.2f}{before / after:>9.1f}x')
+
+    before = min(timeit.repeat(lambda: pig_iron_balance_model(input_data), number=1, repeat=5))
+    after = min(timeit.repeat(lambda: pig_iron_balance_model(input_data, trusted=True), number=1, repeat=5))
+    print(f'{"pig_iron_balance_model":<24}{before * 1e3:>10.2f}ms{after * 1e3:>10.2f}ms{before / after:>9.1f}x')
+
+
+if __name__ == '__main__':
+    run(*sys.argv[1:])
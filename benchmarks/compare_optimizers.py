@@ -0,0 +1,38 @@
+"""
+Runs every optimizer engine on the bundled test cases and prints objective, spills and solve time side by side.
+
+Run from the repository root:
+    python -m benchmarks.compare_optimizers [engine ...]
+"""
+import json
+import os
+import sys
+
+from model.optimizers import OPTIMIZERS
+from utils.model_generator import pig_iron_balance_model
+
+
+def compare(engines=tuple(OPTIMIZERS), test_cases_dir='test_cases'):
+    results = {}
+    for filename in sorted(os.listdir(test_cases_dir)):
+        if not filename.endswith('.json'):
+            continue
+        ct_name = filename.split('.json')[0]
+        with open(os.path.join(test_cases_dir, filename)) as json_file:
+            input_data = json.load(json_file)
+        input_data['optimize_hmr'] = True
+        for engine in engines:
+            pig_iron_balance = pig_iron_balance_model(input_data)
+            report = pig_iron_balance.optimize_hmr(engine=engine)
+            results[(ct_name, engine)] = report
+    return results
+
+
+if __name__ == '__main__':
+    engines = sys.argv[1:] or list(OPTIMIZERS)
+    print(f'{"case":<8}{"engine":<8}{"status":<12}{"objective":>12}{"uplift":>10}{"spills":>8}{"final":>10}'
+          f'{"time [s]":>10}')
+    for (ct_name, engine), report in compare(engines).items():
+        print(f'{ct_name:<8}{report.engine:<8}{report.status[:11]:<12}{report.objective:>12.4f}'
+              f'{report.hmr_uplift:>10.4f}{report.spill_events:>8}{report.final_state:>10.4f}'
+              f'{report.solve_time:>10.3f}')
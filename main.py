@@ -1,40 +1,235 @@
-import copy
+"""
+Pig iron balance HMR optimization.
+
+Run from the repository root:
+    python main.py solve test_cases/ct7.1.json [--engine lp] [--no-plot] [--format json] [--snapshot ct7.1.pibsnap]
+    python main.py batch test_cases --workers 4 [--no-plot] [--cache .cache]
+    python main.py bench [--cases ct5.1 synthetic_7d] [--output report.json]
+    python main.py profile test_cases/ct7.1.json [--profiler pyinstrument] [--output profile.html]
+
+Without a subcommand, every case of test_cases/ is solved as a plain ``batch`` would. Only the standard library is
+imported here; the engine, the plotting stack and the profilers are imported by the subcommands that need them.
+"""
+import argparse
 import json
-import os
+import logging
+import sys
+import time
+from dataclasses import asdict
+from typing import List, Optional
 
-import numpy as np
+ENGINES = ('greedy', 'lp', 'milp')
+SIMULATION_MODES = ('python', 'numpy')
+PLOT_FORMATS = ('png', 'svg', 'pdf', 'html')
+DEFAULT_LOCALE = 'pt_BR.UTF-8'
 
-from utils.model_generator import pig_iron_balance_model
-from utils._test_case_generator import generate_test_case
-from utils.plot_interface import plot_interface
-import locale
 
-# Set the locale to Brazilian Portuguese
-locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
-if __name__ == '__main__':
-    # ct_name = 'ct1'
-    # #generate_test_case(ct_name)
-    # with open(f'test_cases/{ct_name}.json') as json_file:
-    #     input_data = json.load(json_file)
-    for filename in os.listdir('test_cases/'):
-        file_path = os.path.join('test_cases/', filename)
-        if os.path.isfile(file_path):
-            ct_name = filename.split('/')[0].split('.json')[0]
+def set_locale(name: Optional[str]):
+    """
+    Tries the requested locale (used for currency formatting); minimal containers often lack it, which is not an
+    error for the solver.
+    """
+    import locale
+
+    if not name:
+        return
+    try:
+        locale.setlocale(locale.LC_ALL, name)
+    except locale.Error:
+        logging.getLogger(__name__).debug('Locale %s unavailable, keeping %s', name, locale.setlocale(locale.LC_ALL))
+
+
+def result_dict(result) -> dict:
+    row = asdict(result)
+    row.pop('pig_iron_balance', None)
+    return row
+
+
+def print_json(payload):
+    json.dump(payload, sys.stdout, indent=4, default=str)
+    sys.stdout.write('\n')
+
+
+def solve(args) -> int:
+    from utils.batch_runner import print_results, solve_case
+
+    result = solve_case(args.file, args.engine, keep_balance=True, cache_directory=args.cache,
+                        simulation_mode=args.mode)
+    pig_iron_balance = result.pig_iron_balance
+    if result.error is None:
+        if args.snapshot:
+            pig_iron_balance.save_snapshot(args.snapshot)
+        if not args.no_plot:
+            from utils.plot_interface import plot_interface
+
+            start = time.perf_counter()
+            # the solve stands even when rendering fails (e.g. no image export backend)
+            try:
+                plot_interface(result.ct_name, pig_iron_balance, debug=args.show, format=args.plot_format)
+                result.plot_time = time.perf_counter() - start
+            except Exception as error:
+                result.plot_error = repr(error)
+                logging.getLogger(__name__).warning('Plot of %s failed: %s', result.ct_name, result.plot_error)
+
+    if args.format == 'json':
+        row = result_dict(result)
+        report = pig_iron_balance.optimizer_report if pig_iron_balance is not None else None
+        row['optimizer_report'] = asdict(report) if report is not None else None
+        print_json(row)
+    else:
+        print_results([result])
+    return int(result.error is not None)
+
+
+def batch(args) -> int:
+    from utils.batch_runner import DEFAULT_MAX_BYTES, ResultCache, print_results, run_batch
+
+    start = time.perf_counter()
+    cache_max_bytes = int(args.cache_size * 2 ** 20) if args.cache_size else DEFAULT_MAX_BYTES
+    results = run_batch(args.directory, args.workers, not args.no_plot, args.plot_workers, args.engine, args.exclude,
+                        args.cache, cache_max_bytes, args.plot_format, args.mode)
+    if args.format == 'json':
+        print_json([result_dict(result) for result in results])
+    else:
+        print_results(results)
+        print(f'Total: {time.perf_counter() - start:.3f}s')
+        if args.cache:
+            stats = ResultCache(args.cache, cache_max_bytes).stats
+            stats.hits = sum(result.cached for result in results if result.error is None)
+            stats.misses = sum(not result.cached for result in results if result.error is None)
+            print(stats)
+    return int(any(result.error is not None for result in results))
 
-            if ct_name not in ['ct1', 'ct2.1', 'ct2.2','ct3', 'ct4', 'ct5', 'ct6', 'ct7', 'ct8']:
 
+def bench(args) -> int:
+    from benchmarks.bench_engine import main as bench_main
 
+    return bench_main(args.bench_args)
 
-            # if ct_name in ['ct2']:
-            # if ct_name in ['ct1', 'ct2.1', 'ct2.2']:
-                print(ct_name)
-                with open(file_path) as json_file:
-                    input_data = json.load(json_file)
 
-                pig_iron_balance = pig_iron_balance_model(input_data)
-                pig_iron_balance.optimize_hmr()
-                print(f'{ct_name}, {pig_iron_balance.pig_iron_balance[-1].value}')
+def profile(args) -> int:
+    from utils.columnar_loader import load_columnar, pig_iron_balance_from_columns
 
-                plot_interface(ct_name, pig_iron_balance, debug=True)
+    def run():
+        pig_iron_balance = pig_iron_balance_from_columns(load_columnar(args.file), simulation_mode=args.mode)
+        pig_iron_balance.optimize_hmr(engine=args.engine)
+        return pig_iron_balance
 
+    if args.profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print('pyinstrument is not installed (pip install pyinstrument), use --profiler cprofile', file=sys.stderr)
+            return 2
 
+        profiler = Profiler()
+        profiler.start()
+        pig_iron_balance = run()
+        profiler.stop()
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                output_file.write(profiler.output_html() if args.output.endswith('.html') else profiler.output_text())
+        else:
+            print(profiler.output_text(unicode=True, color=sys.stdout.isatty()))
+    else:
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        pig_iron_balance = profiler.runcall(run)
+        if args.output:
+            # binary stats, readable by pstats, snakeviz...
+            profiler.dump_stats(args.output)
+        else:
+            pstats.Stats(profiler, stream=sys.stdout).sort_stats(args.sort).print_stats(args.limit)
+
+    print(pig_iron_balance.instrumentation.summary())
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='engine logs: -v for the optimization summary, -vv for the per-phase timings')
+    parser.add_argument('--locale', default=DEFAULT_LOCALE, help='locale to use when available, "" to skip')
+    subparsers = parser.add_subparsers(dest='command')
+
+    def add_solver_options(subparser, plots=True):
+        subparser.add_argument('--engine', choices=ENGINES, default=None,
+                               help='optimizer backend, defaults to the one of each case file')
+        subparser.add_argument('--mode', choices=SIMULATION_MODES, default=None,
+                               help='simulation mode, defaults to the one of each case file')
+        if plots:
+            subparser.add_argument('--no-plot', action='store_true', help='solves only, without the plotting stack')
+            subparser.add_argument('--plot-format', choices=PLOT_FORMATS, default='png')
+            subparser.add_argument('--format', choices=('text', 'json'), default='text', help='results output')
+            subparser.add_argument('--cache', default=None, help='result cache directory')
+
+    solve_parser = subparsers.add_parser('solve', help='solves (and plots) one case')
+    solve_parser.add_argument('file', help='case JSON file')
+    add_solver_options(solve_parser)
+    solve_parser.add_argument('--snapshot', default=None, help='saves the solved balance to this snapshot file')
+    solve_parser.add_argument('--show', action='store_true', help='also opens the figure')
+    solve_parser.set_defaults(handler=solve)
+
+    batch_parser = subparsers.add_parser('batch', help='solves every case of a directory in parallel')
+    batch_parser.add_argument('directory', nargs='?', default='test_cases')
+    batch_parser.add_argument('--workers', type=int, default=None, help='solver processes, defaults to the CPUs')
+    batch_parser.add_argument('--plot-workers', type=int, default=None)
+    batch_parser.add_argument('--exclude', nargs='*', default=[], help='case names to skip')
+    batch_parser.add_argument('--cache-size', type=float, default=None, help='cache bound in MiB')
+    add_solver_options(batch_parser)
+    batch_parser.set_defaults(handler=batch)
+
+    # everything after ``bench`` is handed to benchmarks.bench_engine untouched, see main
+    bench_parser = subparsers.add_parser('bench', help='engine benchmarks, see benchmarks/bench_engine.py',
+                                         add_help=False)
+    bench_parser.set_defaults(handler=bench)
+
+    profile_parser = subparsers.add_parser('profile', help='profiles solving one case')
+    profile_parser.add_argument('file', help='case JSON file')
+    add_solver_options(profile_parser, plots=False)
+    profile_parser.add_argument('--profiler', choices=('cprofile', 'pyinstrument'), default='cprofile')
+    profile_parser.add_argument('--sort', default='cumulative', help='cProfile sort key')
+    profile_parser.add_argument('--limit', type=int, default=30, help='cProfile rows printed')
+    profile_parser.add_argument('--output', default=None,
+                                help='cProfile: binary stats file; pyinstrument: .html or text report')
+    profile_parser.set_defaults(handler=profile)
+    return parser
+
+
+def command_index(argv: List[str]) -> Optional[int]:
+    """
+    Returns:
+        position of the subcommand, the first argument that is neither a global option nor its value
+    """
+    index = 0
+    while index < len(argv):
+        if argv[index] == '--locale':
+            index += 2
+        elif argv[index].startswith('-'):
+            index += 1
+        else:
+            return index
+    return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    bench_args = []
+    command = command_index(argv)
+    if command is not None and argv[command] == 'bench':
+        argv, bench_args = argv[:command + 1], argv[command + 1:]
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args = parser.parse_args(argv + ['batch'])
+    args.bench_args = bench_args
+    logging.basicConfig(level=(logging.WARNING, logging.INFO, logging.DEBUG)[min(args.verbose, 2)],
+                        format='%(message)s')
+    set_locale(args.locale)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
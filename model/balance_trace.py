@@ -0,0 +1,237 @@
+from collections.abc import Mapping, Sequence
+from datetime import datetime, timedelta
+from enum import IntEnum
+from typing import Iterable, Optional
+
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+ONE_SECOND_US = 1_000_000
+ONE_HOUR_US = 3600 * ONE_SECOND_US
+
+
+class BalanceStateKind(IntEnum):
+    INITIAL = 0
+    PRE_EVENT = 1
+    POST_EVENT = 2
+    SPILL = 3
+    POST_SPILL = 4
+    END = 5
+
+
+def to_microseconds(time: datetime) -> int:
+    return (time - EPOCH) // ONE_MICROSECOND
+
+
+def from_microseconds(time_us) -> datetime:
+    return EPOCH + timedelta(microseconds=int(time_us))
+
+
+def _grow(array: np.ndarray, needed: int) -> np.ndarray:
+    if needed <= len(array):
+        return array
+    grown = np.empty(max(needed, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class BalanceTrace:
+    """
+    Columnar pig iron balance: parallel ``times`` (microseconds since epoch), ``values`` and ``kinds`` arrays plus
+    the position of each converter's pre-event state (its post-event state is always the next one).
+
+    Storage grows geometrically, so appending is amortized O(1) and truncating is free. Every accessor returns a
+    view over the storage, not a copy. ``fork`` shares the storage copy-on-write: both traces copy it before their
+    first write.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._times = np.empty(capacity, dtype=np.int64)
+        self._values = np.empty(capacity, dtype=np.float64)
+        self._kinds = np.empty(capacity, dtype=np.int8)
+        self._event_state_index = np.empty(capacity, dtype=np.int64)
+        self._length = 0
+        self._n_events = 0
+        self._shared = False
+
+    @classmethod
+    def from_states(cls, states: Iterable, kind: BalanceStateKind = BalanceStateKind.PRE_EVENT) -> 'BalanceTrace':
+        trace = cls()
+        for state in states:
+            trace.append(state.time, state.value, kind)
+        return trace
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def times(self) -> np.ndarray:
+        return self._times[:self._length]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values[:self._length]
+
+    @property
+    def kinds(self) -> np.ndarray:
+        return self._kinds[:self._length]
+
+    @property
+    def event_state_index(self) -> np.ndarray:
+        return self._event_state_index[:self._n_events]
+
+    @property
+    def n_events(self) -> int:
+        return self._n_events
+
+    def clear(self):
+        self._length = 0
+        self._n_events = 0
+
+    def truncate(self, length: int, n_events: int):
+        """
+        Drops every state from ``length`` and every converter from ``n_events`` onwards.
+        """
+        self._length = min(self._length, length)
+        self._n_events = min(self._n_events, n_events)
+
+    def fork(self) -> 'BalanceTrace':
+        """
+        Returns:
+            a trace with the same states, sharing this trace's storage until either of them is written
+        """
+        trace = BalanceTrace.__new__(BalanceTrace)
+        trace.__dict__.update(self.__dict__)
+        trace._shared = self._shared = True
+        return trace
+
+    def _reserve(self, length: int, n_events: int):
+        if self._shared:
+            self._times = self._times.copy()
+            self._values = self._values.copy()
+            self._kinds = self._kinds.copy()
+            self._event_state_index = self._event_state_index.copy()
+            self._shared = False
+        self._times = _grow(self._times, length)
+        self._values = _grow(self._values, length)
+        self._kinds = _grow(self._kinds, length)
+        self._event_state_index = _grow(self._event_state_index, n_events)
+
+    def append(self, time: datetime, value: float, kind: BalanceStateKind):
+        self.append_us(to_microseconds(time), value, kind)
+
+    def append_us(self, time_us: int, value: float, kind: BalanceStateKind):
+        self._reserve(self._length + 1, self._n_events)
+        self._times[self._length] = time_us
+        self._values[self._length] = value
+        self._kinds[self._length] = kind
+        self._length += 1
+
+    def mark_event(self):
+        """
+        Registers the next appended state as the pre-event state of the next converter.
+        """
+        self._reserve(self._length, self._n_events + 1)
+        self._event_state_index[self._n_events] = self._length
+        self._n_events += 1
+
+    def extend(self, times: np.ndarray, values: np.ndarray, kinds: np.ndarray,
+               event_state_index: Optional[np.ndarray] = None):
+        """
+        Appends a block of states; ``event_state_index`` is relative to the block.
+        """
+        length = self._length + len(times)
+        n_events = self._n_events + (0 if event_state_index is None else len(event_state_index))
+        self._reserve(length, n_events)
+        self._times[self._length:length] = times
+        self._values[self._length:length] = values
+        self._kinds[self._length:length] = kinds
+        if event_state_index is not None:
+            self._event_state_index[self._n_events:n_events] = event_state_index + self._length
+        self._length = length
+        self._n_events = n_events
+
+    def time(self, index: int) -> datetime:
+        return from_microseconds(self.times[index])
+
+    def value(self, index: int) -> float:
+        return float(self.values[index])
+
+    def post_event_value(self, event_index: int) -> float:
+        return float(self._values[self._event_state_index[event_index] + 1])
+
+    def index_of(self, time: datetime) -> int:
+        """
+        Returns:
+            position of the last state at ``time``; raises KeyError when there is none
+        """
+        time_us = to_microseconds(time)
+        index = int(np.searchsorted(self.times, time_us, side='right')) - 1
+        if index < 0 or self._times[index] != time_us:
+            raise KeyError(time)
+        return index
+
+    def value_at(self, time: datetime) -> float:
+        return float(self._values[self.index_of(time)])
+
+
+class BalanceStateList(Sequence):
+    """
+    Read-only list of ``PigIronBalanceState`` over a ``BalanceTrace``; states are built only when accessed, through
+    ``construct`` since the trace only holds values the engine produced itself. ``scale`` converts the values on
+    access (from p.u. to tonnes, for instance).
+    """
+
+    def __init__(self, trace: BalanceTrace, state_type, scale: float = 1.0):
+        self.trace = trace
+        self.state_type = state_type
+        self.scale = scale
+
+    def __len__(self):
+        return len(self.trace)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[index] for index in range(*item.indices(len(self.trace)))]
+        if item < 0:
+            item += len(self.trace)
+        if not 0 <= item < len(self.trace):
+            raise IndexError(item)
+        return self.state_type.construct(time=self.trace.time(item), value=self.trace.value(item) * self.scale)
+
+    def __iter__(self):
+        construct = self.state_type.construct
+        values = self.trace.values if self.scale == 1.0 else self.trace.values * self.scale
+        for time, value in zip(self.trace.times.tolist(), values.tolist()):
+            yield construct(time=from_microseconds(time), value=value)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class BalanceTraceMap(Mapping):
+    """
+    Read-only ``{time: value}`` view over a ``BalanceTrace``; on duplicated times the last state wins. ``scale``
+    converts the values on access.
+    """
+
+    def __init__(self, trace: BalanceTrace, scale: float = 1.0):
+        self.trace = trace
+        self.scale = scale
+
+    def __getitem__(self, time: datetime) -> float:
+        return self.trace.value_at(time) * self.scale
+
+    def __contains__(self, time) -> bool:
+        try:
+            self.trace.index_of(time)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self):
+        return (from_microseconds(time) for time in np.unique(self.trace.times).tolist())
+
+    def __len__(self):
+        return len(np.unique(self.trace.times))
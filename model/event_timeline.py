@@ -0,0 +1,102 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from heapq import merge
+from typing import List, Optional
+
+
+class EventTimeline:
+    """
+    Time ordered view over the converters and spill events of a pig iron balance.
+
+    Both source lists are kept sorted by the simulator, so the merged timeline is rebuilt lazily in O(n) after an
+    invalidation and every time query is answered with a bisect over the timestamp arrays. On ties converters come
+    before spill events, matching a stable sort of ``converters + spill_events``.
+    """
+
+    def __init__(self, converters: list, spill_events: list):
+        self.converters = converters
+        self.spill_events = spill_events
+        self._events: Optional[list] = None
+        self._times: Optional[List[datetime]] = None
+        self._converter_times: Optional[List[datetime]] = None
+
+    def reset(self, converters: list, spill_events: list):
+        self.converters = converters
+        self.spill_events = spill_events
+        self.invalidate(converters_changed=True)
+
+    def invalidate(self, converters_changed: bool = False):
+        """
+        Must be called whenever spill events are appended or dropped (or converters are moved).
+
+        Args:
+            converters_changed: also drops the converter timestamp array
+        """
+        self._events = None
+        self._times = None
+        if converters_changed:
+            self._converter_times = None
+
+    @property
+    def events(self) -> list:
+        if self._events is None:
+            self._events = list(merge(self.converters, self.spill_events, key=lambda event: event.time))
+            self._times = [event.time for event in self._events]
+        return self._events
+
+    @property
+    def times(self) -> List[datetime]:
+        if self._times is None:
+            _ = self.events
+        return self._times
+
+    @property
+    def converter_times(self) -> List[datetime]:
+        if self._converter_times is None:
+            self._converter_times = [converter.time for converter in self.converters]
+        return self._converter_times
+
+    def __len__(self):
+        return len(self.converters) + len(self.spill_events)
+
+    def __getitem__(self, item):
+        return self.events[item]
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def count_converters_before(self, time: datetime) -> int:
+        """
+        Args:
+            time:
+
+        Returns:
+            number of converters starting strictly before ``time``
+        """
+        return bisect_left(self.converter_times, time)
+
+    def next_event_after(self, time: datetime):
+        """
+        Args:
+            time:
+
+        Returns:
+            first event strictly after ``time`` or None
+        """
+        index = bisect_right(self.times, time)
+        if index < len(self.events):
+            return self.events[index]
+        return None
+
+    def previous_event_before(self, time: datetime):
+        """
+        Args:
+            time:
+
+        Returns:
+            event preceding the first event at or after ``time`` (never the first event itself) or None
+        """
+        index = max(bisect_left(self.times, time), 1)
+        if index < len(self.events):
+            return self.events[index - 1]
+        return None
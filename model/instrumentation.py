@@ -0,0 +1,92 @@
+"""
+Timing spans, counters and callbacks of the simulation and the optimizers.
+
+Phases timed by the engine: ``simulate``, ``plateau_discovery``, ``plateau_filtering`` and ``hmr_update`` (plus
+``lp_solve`` for the LP engines); counters: ``states_allocated``, ``spills_generated`` and ``simulations``. Spans
+are tagged with the current optimizer iteration, 0 being the initial simulation, and only their aggregates are kept:
+memory grows with the phases and iterations of one optimization, not with the number of spans.
+"""
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+
+class Instrumentation:
+    """
+    Callbacks are called as ``callback(event, payload)`` with ``event`` one of 'span', 'iteration' or 'counter'.
+    """
+
+    def __init__(self, callbacks: Optional[List[Callable[[str, dict], None]]] = None):
+        # {phase: {'count', 'total', 'max'}} and {iteration: {phase: seconds}}
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.iterations: Dict[int, Dict[str, float]] = defaultdict(partial(defaultdict, float))
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.callbacks: List[Callable[[str, dict], None]] = list(callbacks or [])
+        self.iteration = 0
+
+    def subscribe(self, callback: Callable[[str, dict], None]):
+        self.callbacks.append(callback)
+
+    def unsubscribe(self, callback: Callable[[str, dict], None]):
+        self.callbacks.remove(callback)
+
+    def emit(self, event: str, **payload):
+        for callback in self.callbacks:
+            callback(event, payload)
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            phase = self.phases.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            phase['count'] += 1
+            phase['total'] += duration
+            phase['max'] = max(phase['max'], duration)
+            self.iterations[self.iteration][name] += duration
+            if self.callbacks:
+                self.emit('span', name=name, iteration=self.iteration, duration=duration)
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] += amount
+        if self.callbacks:
+            self.emit('counter', name=name, amount=amount, total=self.counters[name])
+
+    def end_iteration(self, **payload):
+        """
+        Closes the current iteration; ``payload`` (cost, spill count...) is forwarded to the callbacks.
+        """
+        self.emit('iteration', iteration=self.iteration, **payload)
+        self.iteration += 1
+
+    def reset(self):
+        self.phases.clear()
+        self.iterations.clear()
+        self.counters.clear()
+        self.iteration = 0
+
+    def phase_totals(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns:
+            {phase: {'count', 'total', 'mean', 'max'}}, durations in seconds
+        """
+        return {name: {**phase, 'mean': phase['total'] / phase['count']} for name, phase in self.phases.items()}
+
+    def iteration_table(self) -> Dict[int, Dict[str, float]]:
+        """
+        Returns:
+            {iteration: {phase: seconds}}
+        """
+        return {iteration: dict(phases) for iteration, phases in sorted(self.iterations.items())}
+
+    def summary(self) -> str:
+        lines = [f'{"phase":<20}{"count":>8}{"total [ms]":>12}{"mean [ms]":>12}{"max [ms]":>12}']
+        for name, phase in sorted(self.phase_totals().items(), key=lambda item: -item[1]['total']):
+            lines.append(f'{name:<20}{phase["count"]:>8}{phase["total"] * 1e3:>12.3f}{phase["mean"] * 1e3:>12.3f}'
+                         f'{phase["max"] * 1e3:>12.3f}')
+        lines.append(' - '.join(f'{name}: {value}' for name, value in sorted(self.counters.items())))
+        return '\n'.join(lines)
@@ -0,0 +1,103 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+
+def cv_key(cv: str) -> str:
+    """
+    Maintenances are keyed by the plot labels ('CV 1') and converters by their id ('cv_1'); both map to 'cv_1'.
+    """
+    return cv.strip().lower().replace(' ', '_')
+
+
+class MaintenanceIndex:
+    """
+    Sorted, non-overlapping maintenance windows per converter.
+
+    Overlapping or touching windows of the same converter are merged on insertion, so both the starts and the ends
+    are sorted and every query is a bisect: O(log m) for m windows.
+    """
+
+    def __init__(self):
+        self._starts: Dict[str, List[datetime]] = {}
+        self._ends: Dict[str, List[datetime]] = {}
+
+    @classmethod
+    def from_maintenances(cls, maintenances) -> 'MaintenanceIndex':
+        """
+        Args:
+            maintenances: {cv: [Maintenance]} as built by ``pig_iron_balance_model``
+
+        Returns:
+
+        """
+        index = cls()
+        if isinstance(maintenances, dict):
+            for cv, cv_maintenances in maintenances.items():
+                for maintenance in cv_maintenances:
+                    index.add(cv, maintenance.time, maintenance.time + timedelta(hours=maintenance.duration))
+        return index
+
+    def add(self, cv: str, start: datetime, end: datetime):
+        key = cv_key(cv)
+        starts = self._starts.setdefault(key, [])
+        ends = self._ends.setdefault(key, [])
+        # windows touching [start, end] are absorbed by the new one
+        first = bisect_left(ends, start)
+        last = bisect_right(starts, end)
+        if first < last:
+            start = min(start, starts[first])
+            end = max(end, ends[last - 1])
+            del starts[first:last]
+            del ends[first:last]
+        starts.insert(first, start)
+        ends.insert(first, end)
+
+    def overlaps(self, cv: str, start: datetime, end: datetime) -> bool:
+        """
+        Returns:
+            whether ``[start, end]`` intersects a window of ``cv`` (closed intervals)
+        """
+        key = cv_key(cv)
+        ends = self._ends.get(key)
+        if not ends:
+            return False
+        index = bisect_left(ends, start)
+        return index < len(ends) and self._starts[key][index] <= end
+
+    def is_blocked(self, converter) -> bool:
+        """
+        Returns:
+            whether the converter runs (from its time to its end) while its own converter is under maintenance
+        """
+        key = cv_key(converter.cv)
+        ends = self._ends.get(key)
+        if not ends:
+            return False
+        index = bisect_right(ends, converter.time)
+        return index < len(ends) and self._starts[key][index] < converter.end
+
+    def windows(self, cv: Optional[str] = None) -> List[Tuple[str, datetime, datetime]]:
+        """
+        Returns:
+            (cv, start, end) of every window, of one converter or of all of them, sorted by start
+        """
+        keys = [cv_key(cv)] if cv is not None else sorted(self._starts)
+        windows = [(key, start, end) for key in keys
+                   for start, end in zip(self._starts.get(key, []), self._ends.get(key, []))]
+        return sorted(windows, key=lambda window: window[1])
+
+    def discard_before(self, time: datetime):
+        """
+        Drops every window ended at or before ``time``.
+        """
+        for key, ends in self._ends.items():
+            count = bisect_right(ends, time)
+            del ends[:count]
+            del self._starts[key][:count]
+
+    def __len__(self):
+        return sum(len(starts) for starts in self._starts.values())
+
+    def __bool__(self):
+        return len(self) > 0
@@ -0,0 +1,263 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import numpy as np
+
+from model.balance_trace import ONE_HOUR_US, ONE_SECOND_US, to_microseconds
+
+# Keeps optimized pre-event states strictly under max_restrictive so re-simulation does not round them into a spill
+STATE_MARGIN = 1e-6
+# Part of the result cache key (utils.result_cache): bump it whenever an engine change alters optimized results
+OPTIMIZER_VERSION = 2
+# Default time limit (s) of the milp fallback of lp, which otherwise may run far longer than the greedy engine
+FALLBACK_TIME_LIMIT = 5.0
+
+
+@dataclass
+class OptimizationReport:
+    """
+    Outcome of an HMR optimization, measured on the re-simulated balance so every engine is compared alike.
+
+    ``hmr_uplift`` is the extra pig iron sent to the converters, ``k * sum(hmr - min_hmr)``, in balance units.
+    ``objective`` is the uplift planned by the engine's own model, the penalty of the spills planned by milp being left
+    out (``details['spill_cost']``) so every engine reports the same quantity.
+    """
+    engine: str
+    status: str
+    objective: float
+    hmr_uplift: float
+    spill_events: int
+    final_state: float
+    solve_time: float
+    iterations: int = 0
+    details: Dict = field(default_factory=dict)
+
+
+def hmr_uplift(pig_iron_balance) -> float:
+    return pig_iron_balance.k * sum(cv.hmr - pig_iron_balance.min_hmr for cv in pig_iron_balance.converters)
+
+
+class GreedyOptimizer:
+    """
+    The original heuristic: raises HMRs backwards inside the first virtual plateau until its target is met, then
+    re-simulates, until no plateau can be optimized.
+    """
+    name = 'greedy'
+
+    def optimize(self, pig_iron_balance) -> OptimizationReport:
+        start = time.perf_counter()
+        iterations = pig_iron_balance.greedy_hmr_optimization()
+        solve_time = time.perf_counter() - start
+        uplift = hmr_uplift(pig_iron_balance)
+        return OptimizationReport(
+            engine=self.name,
+            status='converged',
+            objective=uplift,
+            hmr_uplift=uplift,
+            spill_events=len(pig_iron_balance.spill_events),
+            final_state=pig_iron_balance.last_state.value,
+            solve_time=solve_time,
+            iterations=iterations,
+        )
+
+
+class LinearProgramOptimizer:
+    """
+    Exact HMR optimization. Without spills the balance is linear in every ``hmr``: with ``b_j`` the state right after
+    converter ``j`` and ``g_j`` the pig iron produced since the previous one,
+
+        b_j = b_{j-1} + g_j + P/3600 - k * hmr_j - W * s_j
+        b_{j-1} + g_j - W * s_j <= max_restrictive      (state right before converter j, and before the end)
+        b_j >= min_restrictive,  min_hmr <= hmr_j <= max_hmr
+
+    ``lp`` solves it with ``s = 0`` using HiGHS through ``scipy.optimize.linprog``, minimizing the HMR uplift. When the
+    spills cannot be avoided it falls back to ``milp``, where ``s_j`` are integer torpedo cars tipped before converter
+    ``j`` and each costs ``spill_penalty`` times its volume. A simulated spill removes ``W = V - P/3600``: the state after
+    the tipping already carries one second of production and the next state counts it again from the tipping time.
+    """
+    name = 'lp'
+    with_spills = False
+
+    def __init__(self, spill_penalty: float = 1000.0, time_limit: Optional[float] = None):
+        self.spill_penalty = spill_penalty
+        self.time_limit = time_limit
+
+    def build(self, pig_iron_balance):
+        from scipy import sparse
+
+        converters = pig_iron_balance.converters
+        n = len(converters)
+        production = pig_iron_balance.pig_iron_hourly_production
+        per_second = production / 3600
+        k = pig_iron_balance.k
+        volume = pig_iron_balance.pig_iron_constants.torpedo_car_volume
+        spilled = volume - per_second
+
+        times = np.array([to_microseconds(cv.time) for cv in converters], dtype=np.int64)
+        # converters blocked by a maintenance consume nothing and keep min_hmr
+        consumed = np.array([0.0 if pig_iron_balance.is_blocked(cv) else k for cv in converters])
+        start = to_microseconds(pig_iron_balance.initial_conditions.time)
+        # production between the previous state (1 s after the previous converter) and each converter, then the end
+        gaps = np.empty(n + 1, dtype=np.float64)
+        gaps[0] = times[0] - start
+        gaps[1:n] = np.diff(times) - ONE_SECOND_US
+        gaps[n] = ONE_HOUR_US - ONE_SECOND_US
+        produced = production * (gaps / ONE_SECOND_US / 3600)
+
+        n_spills = n + 1 if self.with_spills else 0
+        # variables: hmr (n), post-converter states (n), spills before each converter and before the end
+        n_variables = 2 * n + n_spills
+        hmr, state, spill = np.arange(n), n + np.arange(n), 2 * n + np.arange(n_spills)
+
+        rows = np.arange(n)
+        equality = sparse.coo_matrix(
+            (
+                np.concatenate([np.ones(n), -np.ones(n - 1), consumed] +
+                               ([np.full(n, spilled)] if n_spills else [])),
+                (
+                    np.concatenate([rows, rows[1:], rows] + ([rows] if n_spills else [])),
+                    np.concatenate([state, state[:-1], hmr] + ([spill[:n]] if n_spills else [])),
+                ),
+            ),
+            shape=(n, n_variables),
+        ).tocsr()
+        equality_rhs = produced[:n] + per_second
+        equality_rhs[0] += pig_iron_balance.initial_conditions.value
+
+        # pre-event states: b_{j-1} - W s_j <= max_restrictive - g_j
+        rows = np.arange(n + 1)
+        upper_entries = [np.ones(n)]
+        upper_rows = [rows[1:]]
+        upper_columns = [state]
+        if n_spills:
+            upper_entries.append(np.full(n + 1, -spilled))
+            upper_rows.append(rows)
+            upper_columns.append(spill)
+        upper = sparse.coo_matrix(
+            (np.concatenate(upper_entries), (np.concatenate(upper_rows), np.concatenate(upper_columns))),
+            shape=(n + 1, n_variables),
+        ).tocsr()
+        upper_rhs = pig_iron_balance.max_restrictive - STATE_MARGIN - produced
+        upper_rhs[0] -= pig_iron_balance.initial_conditions.value
+
+        lower_bounds = np.concatenate([
+            np.full(n, pig_iron_balance.min_hmr), np.full(n, pig_iron_balance.min_restrictive), np.zeros(n_spills)
+        ])
+        upper_bounds = np.concatenate([np.where(consumed > 0, pig_iron_balance.max_hmr, pig_iron_balance.min_hmr),
+                                       np.full(n, np.inf), np.full(n_spills, np.inf)])
+        cost = np.concatenate([np.full(n, k), np.zeros(n), np.full(n_spills, self.spill_penalty * volume)])
+        return cost, equality, equality_rhs, upper, upper_rhs, lower_bounds, upper_bounds, hmr, spill
+
+    @staticmethod
+    def objective_offset(pig_iron_balance) -> float:
+        # the cost is k * sum(hmr); report it as the uplift over min_hmr like the greedy engine
+        return pig_iron_balance.k * pig_iron_balance.min_hmr * len(pig_iron_balance.converters)
+
+    def solve(self, pig_iron_balance):
+        from scipy.optimize import linprog
+
+        cost, equality, equality_rhs, upper, upper_rhs, lower_bounds, upper_bounds, hmr, _ = self.build(
+            pig_iron_balance)
+        options = {} if self.time_limit is None else {'time_limit': self.time_limit}
+        result = linprog(cost, A_ub=upper, b_ub=upper_rhs, A_eq=equality, b_eq=equality_rhs,
+                         bounds=np.column_stack([lower_bounds, upper_bounds]), method='highs', options=options)
+        if result.status != 0:
+            return None, result.message, {}
+        return result.x[hmr], 'optimal', {'solver_objective': result.fun - self.objective_offset(pig_iron_balance)}
+
+    def optimize(self, pig_iron_balance) -> OptimizationReport:
+        instrumentation = pig_iron_balance.instrumentation
+        start = time.perf_counter()
+        with instrumentation.span('lp_solve'):
+            if pig_iron_balance.converters:
+                hmrs, status, details = self.solve(pig_iron_balance)
+            else:
+                hmrs, status, details = None, 'optimal', {}
+            engine = self.name
+            if hmrs is None and not self.with_spills and pig_iron_balance.converters:
+                details['lp_status'] = status
+                fallback = MixedIntegerOptimizer(spill_penalty=self.spill_penalty,
+                                                 time_limit=self.time_limit or FALLBACK_TIME_LIMIT)
+                hmrs, status, milp_details = fallback.solve(pig_iron_balance)
+                details.update(milp_details)
+                engine = fallback.name
+        solve_time = time.perf_counter() - start
+
+        iterations = 0
+        if hmrs is not None:
+            with instrumentation.span('hmr_update'):
+                for index, value in enumerate(hmrs.tolist()):
+                    pig_iron_balance.own_converter(index).hmr = min(max(value, pig_iron_balance.min_hmr),
+                                                                    pig_iron_balance.max_hmr)
+            pig_iron_balance.invalidate()
+            pig_iron_balance.generate_pig_iron_balance()
+            iterations = 1
+            instrumentation.end_iteration(cost=pig_iron_balance.total_cost,
+                                          spill_events=len(pig_iron_balance.spill_events))
+
+        uplift = hmr_uplift(pig_iron_balance)
+        return OptimizationReport(
+            engine=engine,
+            status=status,
+            objective=details.get('solver_objective', float('nan')),
+            hmr_uplift=uplift,
+            spill_events=len(pig_iron_balance.spill_events),
+            final_state=pig_iron_balance.last_state.value,
+            solve_time=solve_time,
+            iterations=iterations,
+            details=details,
+        )
+
+
+class MixedIntegerOptimizer(LinearProgramOptimizer):
+    name = 'milp'
+    with_spills = True
+
+    def solve(self, pig_iron_balance):
+        from scipy.optimize import Bounds, LinearConstraint, milp
+
+        cost, equality, equality_rhs, upper, upper_rhs, lower_bounds, upper_bounds, hmr, spill = self.build(
+            pig_iron_balance)
+        integrality = np.zeros(len(cost))
+        integrality[spill] = 1
+        options = {} if self.time_limit is None else {'time_limit': self.time_limit}
+        result = milp(
+            cost,
+            constraints=[LinearConstraint(equality, equality_rhs, equality_rhs),
+                         LinearConstraint(upper, -np.inf, upper_rhs)],
+            integrality=integrality,
+            bounds=Bounds(lower_bounds, upper_bounds),
+            options=options,
+        )
+        if result.x is None:
+            return None, result.message, {}
+        spill_cost = float(cost[spill] @ result.x[spill])
+        return result.x[hmr], 'optimal' if result.status == 0 else result.message, {
+            'solver_objective': result.fun - spill_cost - self.objective_offset(pig_iron_balance),
+            'spill_cost': spill_cost,
+            'planned_spills': int(round(result.x[spill].sum())),
+        }
+
+
+OPTIMIZERS = {
+    GreedyOptimizer.name: GreedyOptimizer,
+    LinearProgramOptimizer.name: LinearProgramOptimizer,
+    MixedIntegerOptimizer.name: MixedIntegerOptimizer,
+}
+
+
+def get_optimizer(engine: str, **kwargs):
+    """
+
+    Args:
+        engine: 'greedy', 'lp' or 'milp'
+        **kwargs: engine options
+
+    Returns:
+        optimizer instance
+    """
+    try:
+        return OPTIMIZERS[engine](**kwargs)
+    except KeyError:
+        raise ValueError(f'Unknown optimizer engine {engine!r}, expected one of {sorted(OPTIMIZERS)}')
@@ -1,13 +1,28 @@
-import locale
+import copy
+import logging
+from bisect import bisect_right
+from collections.abc import Sequence
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import List, Optional
+from heapq import merge
+from typing import List, Optional, Tuple
 
 import numpy as np
 from pydantic import BaseModel, validator
 from typing import List, Dict
 from pydantic import BaseModel, NonNegativeFloat, PositiveFloat, NonNegativeInt
 
+from model.event_timeline import EventTimeline
+from model.instrumentation import Instrumentation
+from model.maintenance_index import MaintenanceIndex
+from model.balance_trace import BalanceStateKind, BalanceStateList, BalanceTrace, BalanceTraceMap, \
+    from_microseconds, to_microseconds
+from model.optimizers import OptimizationReport, get_optimizer
+from model.units import UnitSystem
+from model.vectorized_balance import converter_arrays, simulate_segment, spill_chain, spill_states
+
+logger = logging.getLogger(__name__)
+
 
 class PigIronConstants(BaseModel):
     torpedo_car_volume = 250
@@ -16,6 +31,10 @@ class PigIronConstants(BaseModel):
 
 
 class PigIronEvent(BaseModel):
+    """
+    Models are validated at the JSON boundary only. Objects the engine creates itself from trusted values go
+    through ``construct``, which skips validation (and the ``parse_time`` validator) entirely.
+    """
     time: Optional[datetime]
 
     @validator('time')
@@ -84,6 +103,39 @@ class PigIronBalanceState(PigIronEvent):
         return f"PigIronEvent(time='{time_str}', value={self.value})"
 
 
+class PlateauConverters(Sequence):
+    """
+    First ``length`` converters of the list grown by a plateau sweep. Consecutive plateaus share the list and only
+    differ by their length, so handing one out is O(1).
+    """
+
+    def __init__(self, converters: List[ConverterInPlateau], length: int, max_contribution_sum: float):
+        self.converters = converters
+        self.length = length
+        self.max_contribution_sum = max_contribution_sum
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.converters[index] for index in range(*item.indices(self.length))]
+        if item < 0:
+            item += self.length
+        if not 0 <= item < self.length:
+            raise IndexError(item)
+        return self.converters[item]
+
+    def __iter__(self):
+        return iter(self.converters[:self.length])
+
+    def __reversed__(self):
+        return (self.converters[index] for index in range(self.length - 1, -1, -1))
+
+    def __repr__(self):
+        return repr(list(self))
+
+
 class VirtualPlateau(PigIronEvent):
     available_converters: List[ConverterInPlateau]
     plateau_value: PositiveFloat
@@ -91,9 +143,12 @@ class VirtualPlateau(PigIronEvent):
 
     @property
     def can_be_optimized(self) -> bool:
+        max_contribution_sum = getattr(self.available_converters, 'max_contribution_sum', None)
+        if max_contribution_sum is None:
+            max_contribution_sum = sum(converter.max_contribution for converter in self.available_converters)
         return (
                 len(self.available_converters) > 0 and
-                sum(converter.max_contribution for converter in self.available_converters) > 0
+                max_contribution_sum > 0
         )
     def __repr__(self):
         return f'{self.time} - {[cv.index for cv in self.available_converters]} - {self.hmr_target}'
@@ -112,105 +167,219 @@ class PigIronBalance:
                  max_restrictive: float,
                  allow_auto_spill_events: bool,
                  maintenances: list = [],
-                 optimize = True):
+                 optimize = True,
+                 simulation_mode: str = 'python',
+                 optimizer_engine: str = 'greedy'):
         self.total_cost = 0.0
-        self.initial_conditions: PigIronBalanceState = initial_conditions
-        self.pig_iron_hourly_production: float = pig_iron_hourly_production
+        self.pig_iron_constants: PigIronConstants = PigIronConstants()
+        # every quantity below is normalized to p.u. here, once; the engine never rescales afterwards
+        self.units = UnitSystem(base=self.pig_iron_constants.torpedo_car_volume)
+        self.pig_iron_constants.torpedo_car_volume = self.units.to_pu(self.pig_iron_constants.torpedo_car_volume)
+        self.initial_conditions: PigIronBalanceState = initial_conditions.copy(
+            update={'value': self.units.to_pu(initial_conditions.value)})
+        self.pig_iron_hourly_production: float = self.units.to_pu(pig_iron_hourly_production)
         self.converters: List[Converter] = sorted(converters, key=lambda cv:cv.time)
         self.optimize = optimize
+        # 'python' steps through events one at a time, 'numpy' simulates whole blocks of events column-wise
+        self.simulation_mode = simulation_mode
+        self.balance_trace: BalanceTrace = BalanceTrace()
+        # 'greedy', 'lp' or 'milp', see model.optimizers
+        self.optimizer_engine = optimizer_engine
+        self.optimizer_report: Optional[OptimizationReport] = None
         for i, converter in enumerate(self.converters):
-            converter.index = i
+            if converter.index != i:
+                converter.index = i
 
+        self.event_timeline: EventTimeline = EventTimeline(self.converters, spill_events)
         self.spill_events: List[PigIronTippingEvent] = spill_events
-        self.max_restrictive = max_restrictive
-        self.min_restrictive = 0
+        self.max_restrictive = self.units.to_pu(max_restrictive)
+        self.min_restrictive = self.units.to_pu(0)
         self.max_hmr = 1
         self.min_hmr = 0.8
-        self.k = 250
+        self.k = self.units.to_pu(250)
         self.initial_spill_events = 0
+        self.initial_spill_count = 0
         self.liquid_profit_dict = {}
         self.profit = 0
         self.maintenances = maintenances
+        self.maintenance_index: MaintenanceIndex = MaintenanceIndex.from_maintenances(maintenances)
         self.allow_auto_spill_events: bool = allow_auto_spill_events
-        self.pig_iron_constants: PigIronConstants = PigIronConstants()
-        self.pig_iron_balance: List[PigIronBalanceState] = []
-        self.pig_iron_balance_map: Dict = {}
+        # bumped whenever converters' HMRs or the balance change; derived data is cached against it
+        self.version = 0
+        self.derived_cache: Dict[str, Tuple[int, list]] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # (len(pig_iron_balance), len(spill_events)) right before each converter is simulated, then before the end
+        self.converter_checkpoints: List[Tuple[int, int]] = []
+        # rolling horizon: converters already committed by advance_to
+        self.committed_converters = 0
+        # ids of converter objects shared with a fork (or with the balance this one was forked from), see own_converter
+        self.shared_converters: set = set()
+        self.forked_from_index: Optional[int] = None
+        # timing spans, counters and callbacks, see model.instrumentation
+        self.instrumentation = Instrumentation()
         self.pig_iron_to_hmr_constant = self.pig_iron_constants.converter_efficiency / self.pig_iron_constants.steel_per_run
 
     def convert_to_pu(self, value):
-        return value / self.pig_iron_constants.torpedo_car_volume
+        return self.units.to_pu(value)
+
+    def convert_from_pu(self, value):
+        return self.units.from_pu(value)
+
+    @property
+    def pig_iron_balance(self) -> BalanceStateList:
+        """
+
+        Returns:
+            list-like view of ``balance_trace``; states are materialized only when accessed
+        """
+        return BalanceStateList(self.balance_trace, PigIronBalanceState)
 
-    def convert_pig_iron_balance_to_pu(self):
-        self.k = self.convert_to_pu(self.k)
-        self.pig_iron_hourly_production = self.convert_to_pu(self.pig_iron_hourly_production)
+    @pig_iron_balance.setter
+    def pig_iron_balance(self, pig_iron_balance: List[PigIronBalanceState]):
+        self.balance_trace = BalanceTrace.from_states(pig_iron_balance)
 
-        for state in self.pig_iron_balance:
-            state.value = self.convert_to_pu(state.value)
-            self.pig_iron_balance_map[state.time] = self.convert_to_pu(self.pig_iron_balance_map[state.time])
+    @property
+    def pig_iron_balance_tonnes(self) -> BalanceStateList:
+        """
 
-        # for event in self.spill_events:
-        #     event.value = self.convert_to_pu(event.value)
+        Returns:
+            ``pig_iron_balance`` in tonnes, converted lazily as states are accessed
+        """
+        return BalanceStateList(self.balance_trace, PigIronBalanceState, scale=self.units.base)
 
-        self.max_restrictive = self.convert_to_pu(self.max_restrictive)
-        self.min_restrictive = self.convert_to_pu(self.min_restrictive)
+    @property
+    def pig_iron_balance_map(self) -> BalanceTraceMap:
+        """
 
-        self.initial_conditions.value = self.convert_to_pu(self.initial_conditions.value)
-        self.pig_iron_constants.torpedo_car_volume = self.convert_to_pu(self.pig_iron_constants.torpedo_car_volume)
+        Returns:
+            read-only {time: value} view of ``balance_trace``
+        """
+        return BalanceTraceMap(self.balance_trace)
+
+    @property
+    def last_state(self) -> PigIronBalanceState:
+        return self.pig_iron_balance[-1]
+
+    def get_post_converter_state(self, converter: Converter) -> float:
+        """
+
+        Args:
+            converter: simulated converter
+
+        Returns:
+            balance value right after the converter consumed its pig iron
+        """
+        return self.balance_trace.post_event_value(converter.index)
+
+    @property
+    def spill_events(self) -> List[PigIronTippingEvent]:
+        return self._spill_events
+
+    @spill_events.setter
+    def spill_events(self, spill_events: List[PigIronTippingEvent]):
+        self._spill_events = spill_events
+        self.event_timeline.reset(self.converters, spill_events)
 
     @property
     def sorted_events(self):
         """
 
         Returns:
+            converters and spill events sorted by time, cached by the event timeline
+        """
+        return self.event_timeline.events
 
+    def invalidate(self):
+        """
+        Marks everything derived from the current converters and balance as stale. Must be called after changing
+        converters' HMRs from outside the engine; simulations call it themselves.
         """
-        return sorted(self.converters + self.spill_events, key=lambda event: event.time)
+        self.version += 1
+
+    def cached(self, key: str, build, counted: bool = True):
+        """
+
+        Args:
+            key: name of the derived data
+            build: callable computing it from the current state
+            counted: whether the lookup counts in ``cache_stats``, which measure the plateau and derived data
+
+        Returns:
+            the value built for the current version, computing it at most once per version
+        """
+        cached = self.derived_cache.get(key)
+        if cached is not None and cached[0] == self.version:
+            self.cache_hits += counted
+            return cached[1]
+        self.cache_misses += counted
+        value = build()
+        self.derived_cache[key] = (self.version, value)
+        return value
+
+    @property
+    def cache_stats(self) -> Dict[str, int]:
+        return {'version': self.version, 'hits': self.cache_hits, 'misses': self.cache_misses}
 
     @property
     def virtual_plateaus(self):
         """
 
         Returns:
-
+            virtual plateaus of the current balance, cached per version
         """
-        return list(self.create_virtual_plateaus())
+        def discover():
+            with self.instrumentation.span('plateau_discovery'):
+                return list(self.create_virtual_plateaus())
+
+        return self.cached('virtual_plateaus', discover)
 
     def create_virtual_plateaus(self):
+        """
+        Sweeps the spill events once, in time order. The converters eligible for a plateau (those starting before the
+        converter that follows the tipping) only grow from one plateau to the next, so each converter is turned into
+        a ConverterInPlateau once and every plateau gets a prefix of the same list.
+
+        Returns:
+
+        """
         next_converter_time = self.initial_conditions.time
-        for i, event in enumerate(self.sorted_events):
+        converters_after_tipping = 0
+        converters_scanned = 0
+        available_converters: List[ConverterInPlateau] = []
+        max_contribution_sum = 0.0
+        for event in self.spill_events:
 
-            if type(event) == PigIronTippingEvent and event.time > next_converter_time:
+            if event.time > next_converter_time:
                 tipping_time = event.time
 
-                next_converter_id = None
-                current_id = i + 1
-                while current_id < len(self.sorted_events):
-                    next_event = self.sorted_events[current_id]
-                    if type(next_event) == Converter:
-                        next_converter_id = current_id
-                        break
-                    current_id += 1
-                if next_converter_id is None:
-                    next_converter_time = self.pig_iron_balance[-1].time
+                while (converters_after_tipping < len(self.converters) and
+                       self.converters[converters_after_tipping].time <= tipping_time):
+                    converters_after_tipping += 1
+                if converters_after_tipping == len(self.converters):
+                    next_converter_time = self.last_state.time
                 else:
-                    next_converter_time = self.sorted_events[next_converter_id].time
-                previous_converters = list(self.plateau_converters([cv for cv in self.converters if cv.time < next_converter_time]))
-                plateau_value = self.pig_iron_hourly_production*(
-                    next_converter_time -
-                    (
-                        tipping_time.replace(second=0) if tipping_time.second > 30
-                        else tipping_time.replace(second=0) + timedelta(minutes=1)
-                    )
-                ).total_seconds()/3600
+                    next_converter_time = self.converters[converters_after_tipping].time
+
+                converters_in_range = converters_scanned
+                while (converters_in_range < len(self.converters) and
+                       self.converters[converters_in_range].time < next_converter_time):
+                    converters_in_range += 1
+                for plateau_converter in self.plateau_converters(
+                        self.converters[converters_scanned:converters_in_range]):
+                    available_converters.append(plateau_converter)
+                    max_contribution_sum += plateau_converter.max_contribution
+                converters_scanned = converters_in_range
 
                 plateau_value = self.pig_iron_hourly_production*(
                     next_converter_time - tipping_time
                 ).total_seconds()/3600
                 if plateau_value > 0:
-                    yield VirtualPlateau(
+                    yield VirtualPlateau.construct(
                         time=tipping_time,
                         plateau_value=plateau_value,
-                        available_converters=previous_converters,
+                        available_converters=PlateauConverters(available_converters, len(available_converters),
+                                                               max_contribution_sum),
                         hmr_target=plateau_value / self.k
                     )
 
@@ -245,18 +414,18 @@ class PigIronBalance:
 
         """
         for converter_in_range in sorted(converters, key=lambda cv:cv.time):
-            plateau_converter = ConverterInPlateau(
+            plateau_converter = ConverterInPlateau.construct(
                 cv=converter_in_range.cv,
                 index=converter_in_range.index,
                 time=converter_in_range.time,
                 hmr=converter_in_range.hmr,
                 hmr_min=self.min_hmr,
                 hmr_max=self.max_hmr,
-                post_converter_state=self.pig_iron_balance_map[converter_in_range.time + timedelta(seconds=1)],
+                post_converter_state=self.get_post_converter_state(converter_in_range),
                 pig_iron_restrictive_min=self.min_restrictive,
                 k=self.k
             )
-            if plateau_converter.is_available_to_increase_hmr:
+            if plateau_converter.is_available_to_increase_hmr and not self.is_blocked(converter_in_range):
                 yield plateau_converter
 
     def get_next_event_state(self, spill_event) -> NonNegativeFloat:
@@ -268,10 +437,10 @@ class PigIronBalance:
         Returns:
 
         """
-        for event in self.sorted_events:
-            if event.time > spill_event.time:
-                return self.pig_iron_balance_map[event.time]
-        return self.pig_iron_balance[-1].value
+        next_event = self.event_timeline.next_event_after(spill_event.time)
+        if next_event is not None:
+            return self.pig_iron_balance_map[next_event.time]
+        return self.last_state.value
 
     def get_previous_event_time(self, spill_event) -> datetime:
         """
@@ -282,9 +451,9 @@ class PigIronBalance:
         Returns:
 
         """
-        for event_index, event in enumerate(self.sorted_events):
-            if event.time >= spill_event.time and event_index > 0:
-                return self.sorted_events[event_index - 1].time
+        previous_event = self.event_timeline.previous_event_before(spill_event.time)
+        if previous_event is not None:
+            return previous_event.time
         return self.pig_iron_balance[0].time
 
     def get_violation_time(self, previous_state):
@@ -314,34 +483,30 @@ class PigIronBalance:
         next_state = previous_state.value + self.pig_iron_hourly_production * delta_t_hours
 
         if self.allow_auto_spill_events:
-            while round(next_state, 7) > self.max_restrictive:
-                next_state = self.generate_spill_event(previous_state)
-                delta_t_hours = (event.time - self.spill_events[-1].time).total_seconds() / 3600
-                previous_state = self.pig_iron_balance[-1]
-                next_state = next_state + self.pig_iron_hourly_production * delta_t_hours
+            spill_times, next_state = spill_chain(
+                to_microseconds(previous_state.time), previous_state.value, to_microseconds(event.time), next_state,
+                self.pig_iron_hourly_production, self.max_restrictive, self.pig_iron_constants.torpedo_car_volume
+            )
+            if len(spill_times):
+                self.generate_spill_events(spill_times)
 
         return next_state
 
-    def generate_spill_event(self, previous_state):
+    def generate_spill_events(self, spill_times: np.ndarray):
         """
+        Records the spills of ``spill_chain``: a tipping event and its SPILL / POST_SPILL states for each time.
 
         Args:
-            previous_state:
+            spill_times: microseconds since epoch
 
         Returns:
 
         """
-        violation_time = self.get_violation_time(previous_state)
-
-        spill_event_state = PigIronBalanceState(time=violation_time,
-                                                value=self.max_restrictive)
-        self.pig_iron_balance.append(spill_event_state)
-
-        self.spill_events.append(PigIronTippingEvent(time=violation_time))
-        post_spill_event_state = PigIronBalanceState(time=violation_time + timedelta(seconds=1),
-                                                     value=self.max_restrictive - self.pig_iron_constants.torpedo_car_volume + self.pig_iron_hourly_production / 3600)
-        self.pig_iron_balance.append(post_spill_event_state)
-        return post_spill_event_state.value
+        self.balance_trace.extend(*spill_states(spill_times, self.pig_iron_hourly_production, self.max_restrictive,
+                                                self.pig_iron_constants.torpedo_car_volume))
+        self.spill_events.extend(PigIronTippingEvent.construct(time=from_microseconds(spill_time))
+                                 for spill_time in spill_times.tolist())
+        self.event_timeline.invalidate()
 
     def get_pig_iron_consumption(self, event):
         """
@@ -354,8 +519,27 @@ class PigIronBalance:
         """
         if type(event) == PigIronTippingEvent:
             return self.pig_iron_constants.torpedo_car_volume
+        if self.is_blocked(event):
+            return 0.0
         return event.hmr * self.k
 
+    def is_blocked(self, converter: Converter) -> bool:
+        """
+        Args:
+            converter:
+
+        Returns:
+            whether the converter falls in a maintenance window of its own converter; it is simulated without
+            consuming pig iron and its HMR is never raised
+        """
+        return bool(self.maintenance_index) and self.maintenance_index.is_blocked(converter)
+
+    @property
+    def blocked_converters(self) -> List[Converter]:
+        # bookkeeping for the optimization log, kept out of the cache statistics
+        return self.cached('blocked_converters', lambda: [cv for cv in self.converters if self.is_blocked(cv)],
+                           counted=False)
+
     def add_new_event_to_pig_iron_balance(self, event):
         """
 
@@ -368,14 +552,12 @@ class PigIronBalance:
 
         previous_state = self.pig_iron_balance[-1]
 
-        next_state = PigIronBalanceState(time=event.time,
-                                         value=self.get_next_value(previous_state, event))
-        self.pig_iron_balance.append(next_state)
+        next_value = self.get_next_value(previous_state, event)
+        self.balance_trace.mark_event()
+        self.balance_trace.append(event.time, next_value, BalanceStateKind.PRE_EVENT)
 
-        post_event_state = PigIronBalanceState(time=event.time + timedelta(seconds=1),
-                                               value=next_state.value - self.get_pig_iron_consumption(
-                                                   event) + self.pig_iron_hourly_production / 3600)
-        self.pig_iron_balance.append(post_event_state)
+        post_event_value = next_value - self.get_pig_iron_consumption(event) + self.pig_iron_hourly_production / 3600
+        self.balance_trace.append(event.time + timedelta(seconds=1), post_event_value, BalanceStateKind.POST_EVENT)
 
     def finish_balance(self):
         """
@@ -386,32 +568,340 @@ class PigIronBalance:
 
         previous_state = self.pig_iron_balance[-1]
 
-        end_of_simulation = PigIronEvent(time=self.sorted_events[-1].time + timedelta(minutes=60))
-        last_state = PigIronBalanceState(time=end_of_simulation.time,
-                                         value=self.get_next_value(previous_state, end_of_simulation))
-        self.pig_iron_balance.append(last_state)
+        last_event_time = self.sorted_events[-1].time if len(self.sorted_events) else previous_state.time
+        end_of_simulation = PigIronEvent.construct(time=last_event_time + timedelta(minutes=60))
+        self.balance_trace.append(end_of_simulation.time, self.get_next_value(previous_state, end_of_simulation),
+                                  BalanceStateKind.END)
 
-    def generate_pig_iron_balance(self) -> List[PigIronBalanceState]:
+    def generate_pig_iron_balance(self, from_index: int = 0) -> BalanceStateList:
         """
+        Simulates the pig iron balance. When ``from_index`` points to a converter already simulated (or right past the
+        last one), the states and spill events preceding it are reused and only the remaining converters are replayed.
+
+        Args:
+            from_index: index of the first converter whose HMR changed (or that was added) since the last simulation
 
         Returns:
 
         """
-        self.pig_iron_balance = []
-        self.spill_events = []
-        # Add initial condition
-        self.pig_iron_balance.append(PigIronBalanceState(time=self.initial_conditions.time,
-                                                         value=self.initial_conditions.value))
-        for event in self.sorted_events:
-            self.add_new_event_to_pig_iron_balance(event)
-
-        # Add end of simulation
-        self.finish_balance()
+        with self.instrumentation.span('simulate'):
+            if 0 < from_index < len(self.converter_checkpoints):
+                self.restore_converter_checkpoint(from_index)
+            else:
+                from_index = 0
+                self.balance_trace.clear()
+                self.spill_events = []
+                self.converter_checkpoints = []
+                # Add initial condition
+                self.balance_trace.append(self.initial_conditions.time, self.initial_conditions.value,
+                                          BalanceStateKind.INITIAL)
+            balance_length, spill_events_length = len(self.balance_trace), len(self.spill_events)
+
+            if self.simulation_mode == 'numpy':
+                self.simulate_vectorized_pig_iron_balance(from_index)
+            else:
+                for event in self.converters[from_index:]:
+                    self.converter_checkpoints.append((len(self.balance_trace), len(self.spill_events)))
+                    self.add_new_event_to_pig_iron_balance(event)
+
+                # Add end of simulation
+                self.converter_checkpoints.append((len(self.balance_trace), len(self.spill_events)))
+                self.finish_balance()
+        self.instrumentation.count('simulations')
+        self.instrumentation.count('states_allocated', len(self.balance_trace) - balance_length)
+        self.instrumentation.count('spills_generated', len(self.spill_events) - spill_events_length)
         #self.calculate_total_cost()
-        self.pig_iron_balance_map = {b.time:b.value for b in self.pig_iron_balance}
-        self.convert_pig_iron_balance_to_pu()
+        self.invalidate()
         return self.pig_iron_balance
 
+    def simulate_vectorized_pig_iron_balance(self, from_index: int):
+        """
+        Numpy counterpart of the per-event loop in ``generate_pig_iron_balance``: simulates the converters from
+        ``from_index`` onwards and the end of simulation with ``simulate_segment``.
+
+        Args:
+            from_index: index of the first converter to simulate
+
+        Returns:
+
+        """
+        event_times, consumptions = converter_arrays(self.converters[from_index:], self.k, self.maintenance_index)
+        balance_length, spill_events_length = len(self.balance_trace), len(self.spill_events)
+        # events kept from a checkpoint: the end of simulation still follows the last of them
+        kept_events = [to_microseconds(self.converters[from_index - 1].time)] if from_index else []
+        if self.spill_events:
+            kept_events.append(to_microseconds(self.spill_events[-1].time))
+        segment = simulate_segment(
+            start_time=int(self.balance_trace.times[-1]),
+            start_value=float(self.balance_trace.values[-1]),
+            event_times=event_times,
+            consumptions=consumptions,
+            production=self.pig_iron_hourly_production,
+            max_restrictive=self.max_restrictive,
+            torpedo_car_volume=self.pig_iron_constants.torpedo_car_volume,
+            allow_auto_spill_events=self.allow_auto_spill_events,
+            last_event_time=max(kept_events) if kept_events else None,
+        )
+        self.balance_trace.extend(segment.times, segment.values, segment.kinds, segment.event_state_index)
+        self.converter_checkpoints.extend(
+            (balance_length + states, spill_events_length + spills)
+            for states, spills in segment.checkpoints.tolist()
+        )
+        self.spill_events.extend(
+            PigIronTippingEvent.construct(time=from_microseconds(time)) for time in segment.spill_times.tolist()
+        )
+        self.event_timeline.invalidate()
+
+    def restore_converter_checkpoint(self, converter_index: int) -> int:
+        """
+        Drops every state and spill event simulated from the given converter onwards.
+
+        Args:
+            converter_index: index of the converter to restart the simulation from
+
+        Returns:
+            number of states kept
+        """
+        balance_length, spill_events_length = self.converter_checkpoints[converter_index]
+        self.balance_trace.truncate(balance_length, converter_index)
+        del self.spill_events[spill_events_length:]
+        self.event_timeline.invalidate()
+        del self.converter_checkpoints[converter_index:]
+        return balance_length
+
+    def value_at(self, time: datetime) -> float:
+        """
+        Args:
+            time:
+
+        Returns:
+            simulated balance at ``time``, interpolated from the last state at or before it
+        """
+        times = self.balance_trace.times
+        index = max(int(np.searchsorted(times, to_microseconds(time), side='right')) - 1, 0)
+        state_time = self.balance_trace.time(index)
+        if self.balance_trace.kinds[index] == BalanceStateKind.POST_SPILL:
+            # like get_next_value, production after a spill is counted from the tipping itself
+            state_time -= timedelta(seconds=1)
+        elapsed_hours = (time - state_time).total_seconds() / 3600
+        return self.balance_trace.value(index) + self.pig_iron_hourly_production * elapsed_hours
+
+    def push_converters(self, converters: List[Converter], reoptimize: Optional[bool] = None):
+        """
+        Rolling horizon: adds newly scheduled converters to the open window. The balance is replayed from the first new
+        converter only and, when optimization is on, the window is re-optimized starting from the current HMRs.
+
+        Args:
+            converters: converters starting at or after the committed horizon (``initial_conditions.time``)
+            reoptimize: defaults to ``optimize``
+
+        Returns:
+            the optimization report, None when not re-optimized
+        """
+        converters = sorted(converters, key=lambda cv: cv.time)
+        if not converters:
+            return None
+        if converters[0].time < self.initial_conditions.time:
+            raise ValueError(f'Converter at {converters[0].time} precedes the committed horizon '
+                             f'{self.initial_conditions.time}')
+
+        first = bisect_right(self.event_timeline.converter_times, converters[0].time)
+        self.converters[first:] = list(merge(self.converters[first:], converters, key=lambda cv: cv.time))
+        self.reindex_converters(first)
+        self.event_timeline.invalidate(converters_changed=True)
+
+        if len(self.balance_trace):
+            self.generate_pig_iron_balance(from_index=first)
+        if not (self.optimize if reoptimize is None else reoptimize):
+            return None
+        return self.reoptimize()
+
+    def advance_to(self, now: datetime, measured_balance: Optional[float] = None) -> List[Converter]:
+        """
+        Rolling horizon: commits everything before ``now``. Converters starting before it leave the model together
+        with the spills predicted before it, and the balance restarts at ``now``, so memory is bounded by the open
+        window instead of the whole history.
+
+        Args:
+            now: new start of the window, not before ``initial_conditions.time``
+            measured_balance: plant measurement at ``now``, in input units (tonnes); the simulated value when omitted
+
+        Returns:
+            the committed converters
+        """
+        if now < self.initial_conditions.time:
+            raise ValueError(f'Cannot advance to {now}, the window already starts at {self.initial_conditions.time}')
+        if not len(self.balance_trace):
+            self.generate_pig_iron_balance()
+
+        if measured_balance is None:
+            value = self.value_at(now)
+        else:
+            value = self.units.to_pu(measured_balance)
+
+        committed = self.event_timeline.count_converters_before(now)
+        committed_converters = self.converters[:committed]
+        del self.converters[:committed]
+        self.reindex_converters()
+        self.committed_converters += committed
+
+        self.maintenance_index.discard_before(now)
+        if isinstance(self.maintenances, dict):
+            self.maintenances = {
+                cv: [mnt for mnt in cv_mnt if mnt.time + timedelta(hours=mnt.duration) > now]
+                for cv, cv_mnt in self.maintenances.items()
+            }
+        self.initial_conditions = PigIronBalanceState.construct(time=now, value=value)
+        self.generate_pig_iron_balance()
+        return committed_converters
+
+    def own_converter(self, index: int) -> Converter:
+        """
+        Every change to a converter goes through here: a converter still shared with a fork is copied first, so
+        forks never see each other's changes.
+
+        Args:
+            index: converter index
+
+        Returns:
+            the converter, safe to modify
+        """
+        converter = self.converters[index]
+        if id(converter) in self.shared_converters:
+            self.shared_converters.discard(id(converter))
+            converter = converter.copy()
+            self.converters[index] = converter
+        return converter
+
+    def reindex_converters(self, first: int = 0):
+        for index in range(first, len(self.converters)):
+            if self.converters[index].index != index:
+                self.own_converter(index).index = index
+
+    def fork(self, converters: Optional[Dict[int, dict]] = None,
+             pig_iron_hourly_production: Optional[float] = None,
+             max_restrictive: Optional[float] = None,
+             maintenances: Optional[Dict[str, List[Maintenance]]] = None) -> 'PigIronBalance':
+        """
+        What-if copy of this balance with a delta applied. Converters, spill events and the balance trace are shared
+        copy-on-write, and the fork is re-simulated from its earliest change only.
+
+        Args:
+            converters: changed fields per converter index, e.g. ``{12: {'time': ...}}`` or ``{12: {'hmr': 0.9}}``
+            pig_iron_hourly_production: in input units (t/h); re-simulates everything
+            max_restrictive: in input units (t); re-simulates everything
+            maintenances: windows added to the fork, ``{'CV 1': [Maintenance]}``
+
+        Returns:
+            the simulated fork
+        """
+        if not len(self.balance_trace):
+            self.generate_pig_iron_balance()
+
+        fork = copy.copy(self)
+        fork.initial_conditions = self.initial_conditions.copy()
+        fork.pig_iron_constants = self.pig_iron_constants.copy()
+        self.shared_converters.update(id(converter) for converter in self.converters)
+        fork.shared_converters = set(self.shared_converters)
+        fork.converters = list(self.converters)
+        fork.balance_trace = self.balance_trace.fork()
+        fork._spill_events = list(self.spill_events)
+        fork.event_timeline = EventTimeline(fork.converters, fork._spill_events)
+        fork.converter_checkpoints = list(self.converter_checkpoints)
+        if isinstance(self.maintenances, dict):
+            fork.maintenances = {cv: list(cv_maintenances) for cv, cv_maintenances in self.maintenances.items()}
+        fork.maintenance_index = MaintenanceIndex.from_maintenances(fork.maintenances)
+        fork.derived_cache = {}
+        fork.cache_hits = fork.cache_misses = 0
+        fork.liquid_profit_dict = dict(self.liquid_profit_dict)
+        fork.optimizer_report = None
+        fork.instrumentation = Instrumentation(self.instrumentation.callbacks)
+
+        from_index = len(fork.converters)
+        if converters:
+            changed = []
+            for index, changes in converters.items():
+                converter = fork.own_converter(index)
+                for name, value in changes.items():
+                    setattr(converter, name, value)
+                changed.append(converter)
+                from_index = min(from_index, index)
+            if any('time' in changes for changes in converters.values()):
+                fork.converters.sort(key=lambda cv: cv.time)
+                fork.event_timeline.invalidate(converters_changed=True)
+                changed_ids = {id(converter) for converter in changed}
+                from_index = min(from_index, min(index for index, converter in enumerate(fork.converters)
+                                                 if id(converter) in changed_ids))
+                fork.reindex_converters(from_index)
+
+        for cv, cv_maintenances in (maintenances or {}).items():
+            if isinstance(fork.maintenances, dict):
+                fork.maintenances.setdefault(cv, []).extend(cv_maintenances)
+            for maintenance in cv_maintenances:
+                fork.maintenance_index.add(cv, maintenance.time,
+                                           maintenance.time + timedelta(hours=maintenance.duration))
+                # converters ending after the window starts may become blocked
+                from_index = min(from_index, bisect_right(fork.event_timeline.converter_times,
+                                                          maintenance.time - timedelta(minutes=60)))
+
+        if pig_iron_hourly_production is not None:
+            fork.pig_iron_hourly_production = fork.units.to_pu(pig_iron_hourly_production)
+            from_index = 0
+        if max_restrictive is not None:
+            fork.max_restrictive = fork.units.to_pu(max_restrictive)
+            from_index = 0
+
+        fork.forked_from_index = from_index
+        fork.invalidate()
+        fork.generate_pig_iron_balance(from_index=from_index)
+        return fork
+
+    def reoptimize(self, engine: Optional[str] = None, **engine_options) -> OptimizationReport:
+        """
+        Optimizes the current window without re-simulating it from scratch and without printing; the greedy engine
+        keeps the HMRs raised by previous updates and only raises more.
+
+        Args:
+            engine: see ``optimize_hmr``
+            **engine_options:
+
+        Returns:
+            the optimization report
+        """
+        # timings cover the latest update only, so a rolling horizon does not accumulate them
+        self.instrumentation.reset()
+        if not len(self.balance_trace):
+            self.generate_pig_iron_balance()
+        self.optimizer_report = get_optimizer(engine or self.optimizer_engine, **engine_options).optimize(self)
+        return self.optimizer_report
+
+    def save_snapshot(self, path: str):
+        """
+        Writes converters with their final HMRs, spill events, the balance and the optimization history to a
+        binary snapshot, see ``model.snapshot``.
+
+        Args:
+            path: snapshot file
+
+        Returns:
+
+        """
+        from model.snapshot import save_snapshot
+        save_snapshot(self, path)
+
+    @classmethod
+    def load_snapshot(cls, path: str, mmap: bool = True) -> 'PigIronBalance':
+        """
+        Args:
+            path: snapshot file written by ``save_snapshot``
+            mmap: the balance is backed by the mapped file and copied only if re-simulated
+
+        Returns:
+            the balance as it was saved, without simulating it again
+        """
+        from model.snapshot import load_snapshot
+        return load_snapshot(path, mmap).to_balance()
+
     def calculate_total_cost(self) -> str:
         steel_loss = (
             (
@@ -471,58 +961,92 @@ class PigIronBalance:
             ))
         )
         total_cost = round(pig_iron_cost + scrap_cost)
-        self.total_cost = max(0,(self.pig_iron_balance[-1].value - self.initial_spill_events))*4300
+        self.total_cost = max(0,(self.last_state.value - self.initial_spill_events))*4300
         return self.total_cost
 
-    def optimize_hmr(self):
+    def optimize_hmr(self, engine: Optional[str] = None, **engine_options):
+        """
+        Simulates the balance and, when enabled, optimizes the converters' HMRs.
+
+        Args:
+            engine: optimizer backend, defaults to ``optimizer_engine``
+            **engine_options: forwarded to the backend
+
+        Returns:
+            the optimization report, None when optimization is disabled
+        """
+        self.instrumentation.reset()
         self.generate_pig_iron_balance()
+        self.initial_spill_count = len(self.spill_events)
         if not self.optimize:
             return None
-        self.initial_spill_events = self.pig_iron_balance[-1].value
-        if len(self.maintenances) > 0:
-            for cv_mnt in self.maintenances.values():
-                for mnt in cv_mnt:
-                    print(f'Mnt: {mnt.time} - Duration: {mnt.duration}')
-        print(f'Basc Inicial: {len(self.spill_events)}')
-        print(f'Last State: {self.pig_iron_balance[-1].value}')
+        self.initial_spill_events = self.last_state.value
+        for cv, start, end in self.maintenance_index.windows():
+            logger.info('Mnt: %s - Duration: %s', start, (end - start).total_seconds() / 3600)
+        if self.blocked_converters:
+            logger.info('Blocked by maintenance: %d converters', len(self.blocked_converters))
+        logger.info('Basc Inicial: %d', len(self.spill_events))
+        logger.info('Last State: %s', self.last_state.value)
         initial_cost = self.total_cost
-        it = 0
-        self.liquid_profit_dict = {it:initial_cost}
+        self.liquid_profit_dict = {0: initial_cost}
+        self.instrumentation.end_iteration(cost=initial_cost, spill_events=len(self.spill_events))
 
+        self.optimizer_report = get_optimizer(engine or self.optimizer_engine, **engine_options).optimize(self)
+        if self.optimizer_report.engine != 'greedy':
+            self.liquid_profit_dict[1] = self.total_cost
+
+        self.total_cost = max(0.0, (self.last_state.value - self.initial_spill_events)* 4300.0)
+        #self.profit = initial_cost - self.total_cost
+        logger.info('Basc Final: %d', len(self.spill_events))
+        logger.info('Last State: %s', self.last_state.value)
+        logger.info('Gain State: %s', self.last_state.value - self.initial_spill_events)
+        logger.info('Cache: %d hits / %d misses', self.cache_hits, self.cache_misses)
+        logger.info('Engine: %s (%s) - Objective: %s - Solve time: %.3fs', self.optimizer_report.engine,
+                    self.optimizer_report.status, self.optimizer_report.objective, self.optimizer_report.solve_time)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Phases:\n%s', self.instrumentation.summary())
+        return self.optimizer_report
+
+    def greedy_hmr_optimization(self) -> int:
+        """
+        Raises HMRs backwards inside the first virtual plateau until its target is met and re-simulates, until no
+        plateau can be optimized.
+
+        Returns:
+            number of iterations
+        """
+        it = 0
         while self.virtual_plateaus_to_be_optimized:
             it += 1
             virtual_plateau = self.virtual_plateaus_to_be_optimized[0]
 
-            for converter in reversed(virtual_plateau.available_converters):
+            first_changed_index = len(self.converters)
+            with self.instrumentation.span('hmr_update'):
+                for converter in reversed(virtual_plateau.available_converters):
+                    first_changed_index = min(first_changed_index, converter.index)
 
-                # Converter can decrease hmr_target
-                if virtual_plateau.hmr_target > converter.max_contribution:
-                    self.converters[converter.index].hmr += converter.max_contribution
-                    virtual_plateau.hmr_target -= converter.max_contribution
+                    # Converter can decrease hmr_target
+                    if virtual_plateau.hmr_target > converter.max_contribution:
+                        self.own_converter(converter.index).hmr += converter.max_contribution
+                        virtual_plateau.hmr_target -= converter.max_contribution
 
-                else:
-                    self.converters[converter.index].hmr += virtual_plateau.hmr_target
-                    virtual_plateau.hmr_target = 0
-                    break
-            self.generate_pig_iron_balance()
+                    else:
+                        self.own_converter(converter.index).hmr += virtual_plateau.hmr_target
+                        virtual_plateau.hmr_target = 0
+                        break
+            self.invalidate()
+            self.generate_pig_iron_balance(from_index=first_changed_index)
             self.liquid_profit_dict[it+1] = self.total_cost
-        self.total_cost = max(0.0, (self.pig_iron_balance[-1].value - self.initial_spill_events)* 4300.0)
-            # if it == 4:
-            #     break
-        a = 1
-        #self.profit = initial_cost - self.total_cost
-        print(f'Basc Final: {len(self.spill_events)}')
-        print(f'Last State: {self.pig_iron_balance[-1].value}')
-        print(f'Gain State: {self.pig_iron_balance[-1].value-self.initial_spill_events}')
-
-
+            self.instrumentation.end_iteration(cost=self.total_cost, spill_events=len(self.spill_events),
+                                               resimulated_from=first_changed_index)
+        return it
 
     @property
     def virtual_plateaus_to_be_optimized(self):
-        return sorted(
-            [
-                virtual_plateau for virtual_plateau in self.virtual_plateaus
-                if virtual_plateau.can_be_optimized
-            ],
-            key=lambda plateau: plateau.time
-        )
+        # create_virtual_plateaus already yields plateaus in time order
+        def select():
+            virtual_plateaus = self.virtual_plateaus
+            with self.instrumentation.span('plateau_filtering'):
+                return [virtual_plateau for virtual_plateau in virtual_plateaus if virtual_plateau.can_be_optimized]
+
+        return self.cached('virtual_plateaus_to_be_optimized', select)
@@ -0,0 +1,185 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from model.balance_trace import ONE_HOUR_US, from_microseconds
+from model.vectorized_balance import converter_arrays
+
+# Samples are evaluated in chunks so the (samples x events) matrices stay small
+CHUNK_SIZE = 2048
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+
+@dataclass
+class RobustnessReport:
+    """
+    Monte Carlo evaluation of an HMR plan. Intervals are the gaps before each planned converter, whatever converter
+    precedes it in a sample, plus the gap before the end of simulation; ``interval_times`` holds their planned end and
+    ``interval_labels`` the converter they lead to.
+    """
+    samples: int
+    interval_times: List[datetime]
+    interval_labels: List[str]
+    spill_probability: np.ndarray
+    expected_spills: np.ndarray
+    shortage_probability: np.ndarray
+    nominal_spills: np.ndarray
+    spill_count_distribution: np.ndarray
+    final_balance: np.ndarray
+    final_balance_percentiles: Dict[int, float] = field(default_factory=dict)
+
+    @property
+    def any_spill_probability(self) -> float:
+        return 1.0 - float(self.spill_count_distribution[0]) / self.samples
+
+    def tipping_points(self, threshold: float = 0.05) -> List[tuple]:
+        """
+        Returns:
+            (planned time, spill probability, nominal spills) of the intervals spilling with at least ``threshold``
+            probability
+        """
+        return [(self.interval_times[index], float(self.spill_probability[index]), int(self.nominal_spills[index]))
+                for index in np.flatnonzero(self.spill_probability >= threshold)]
+
+    def summary(self) -> str:
+        lines = [
+            f'Samples: {self.samples}',
+            f'P(any spill): {self.any_spill_probability:.4f} - '
+            f'E[spills]: {float(self.expected_spills.sum()):.3f} - '
+            f'P(shortage): {float(self.shortage_probability.max(initial=0.0)):.4f}',
+            'Final balance: ' + ' '.join(f'p{q}={value:.4f}' for q, value in self.final_balance_percentiles.items()),
+        ]
+        for index in np.flatnonzero(self.spill_probability >= 0.05):
+            probability, nominal = float(self.spill_probability[index]), int(self.nominal_spills[index])
+            lines.append(f'  {self.interval_labels[index]} at {self.interval_times[index]}: '
+                         f'P(spill)={probability:.4f} (plan: {nominal})')
+        return '\n'.join(lines)
+
+
+def simulate_samples(start_time: int, start_value: float, event_times: np.ndarray, consumptions: np.ndarray,
+                     production: np.ndarray, max_restrictive: float, torpedo_car_volume: float) -> tuple:
+    """
+    Simulates every sample at once. Without spills the balance right before each event is a cumulative sum, computed
+    for the whole (samples x events) matrix in one go. Spills are then resolved with one vectorized step per event:
+    as in ``spill_chain``, the first torpedo car tipped in a gap removes ``V - P/3600`` from every following state
+    and each further one a whole ``V``.
+
+    Args:
+        start_time: time of the initial state, in microseconds since epoch
+        start_value: value of the initial state
+        event_times: (samples x events) converter times, sorted in each row, in microseconds since epoch
+        consumptions: (samples x events) pig iron consumed by each converter
+        production: (samples,) pig iron hourly production
+        max_restrictive:
+        torpedo_car_volume:
+
+    Returns:
+        (samples x events + 1) balance right before each converter and at the end, (samples x events + 1) spills
+        in the gap before each of them, (samples x events) balance right after each converter
+    """
+    samples, n_events = event_times.shape
+    per_second = production / 3600
+    end_times = (event_times[:, -1:] if n_events else np.full((samples, 1), start_time)) + ONE_HOUR_US
+    hours = (np.concatenate([event_times, end_times], axis=1) - start_time) / ONE_HOUR_US
+
+    consumed = np.zeros((samples, n_events + 1))
+    np.cumsum(consumptions, axis=1, out=consumed[:, 1:])
+    pre = start_value + production[:, np.newaxis] * hours - consumed
+
+    spills = np.zeros((samples, n_events + 1))
+    removed = np.zeros(samples)
+    for index in range(n_events + 1):
+        column = pre[:, index] - removed
+        spilling = np.round(column, 7) > max_restrictive
+        if spilling.any():
+            tipped = np.where(spilling, np.maximum(
+                np.ceil((column - max_restrictive + per_second) / torpedo_car_volume), 1), 0)
+            removed = removed + tipped * torpedo_car_volume - np.where(spilling, per_second, 0)
+            spills[:, index] = tipped
+            column = pre[:, index] - removed
+        pre[:, index] = column
+    post = pre[:, :-1] - consumptions + per_second[:, np.newaxis]
+    return pre, spills, post
+
+
+def evaluate_plan(pig_iron_balance, samples: int = 5000, production_std: float = 0.03,
+                  delay_mean_minutes: float = 0.0, delay_std_minutes: float = 10.0,
+                  seed: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> RobustnessReport:
+    """
+    Monte Carlo robustness of the current HMR plan: every sample draws one hourly production and one start delay
+    per converter, and all samples are simulated together as (samples x events) matrices.
+
+    Args:
+        pig_iron_balance: simulated (usually optimized) balance; its HMRs are the plan
+        samples: number of samples
+        production_std: standard deviation of the hourly production, relative to the planned one
+        delay_mean_minutes: mean converter start delay
+        delay_std_minutes: standard deviation of the converter start delay
+        seed: makes the sampling reproducible
+        chunk_size: samples evaluated at once
+
+    Returns:
+
+    """
+    if samples <= 0:
+        raise ValueError(f'evaluate_plan needs at least one sample, got {samples}')
+    if not len(pig_iron_balance.balance_trace):
+        pig_iron_balance.generate_pig_iron_balance()
+
+    trace = pig_iron_balance.balance_trace
+    start_time, start_value = int(trace.times[0]), float(trace.values[0])
+    planned_times, planned_consumptions = converter_arrays(pig_iron_balance.converters, pig_iron_balance.k,
+                                                           pig_iron_balance.maintenance_index)
+    n_events = len(planned_times)
+    production = pig_iron_balance.pig_iron_hourly_production
+    max_restrictive = pig_iron_balance.max_restrictive
+    torpedo_car_volume = pig_iron_balance.pig_iron_constants.torpedo_car_volume
+    min_restrictive = pig_iron_balance.min_restrictive
+    rng = np.random.default_rng(seed)
+
+    spill_hits = np.zeros(n_events + 1)
+    spill_totals = np.zeros(n_events + 1)
+    shortage_hits = np.zeros(n_events)
+    spill_counts = []
+    final_balance = []
+    for chunk_start in range(0, samples, chunk_size):
+        size = min(chunk_size, samples - chunk_start)
+        sampled_production = np.maximum(production * (1 + production_std * rng.standard_normal(size)), 0.0)
+        delays = delay_mean_minutes + delay_std_minutes * rng.standard_normal((size, n_events))
+        times = planned_times + np.round(delays * 60e6).astype(np.int64)
+        # a delayed heat may overtake the next one; the balance only depends on the time order
+        order = np.argsort(times, axis=1, kind='stable')
+        times = np.take_along_axis(times, order, axis=1)
+        consumptions = planned_consumptions[order]
+
+        pre, spills, post = simulate_samples(start_time, start_value, times, consumptions, sampled_production,
+                                             max_restrictive, torpedo_car_volume)
+        # columns follow each sample's time order: count them against the planned converter they belong to
+        intervals = np.concatenate([order, np.full((size, 1), n_events)], axis=1).ravel()
+        spill_hits += np.bincount(intervals, weights=(spills > 0).ravel(), minlength=n_events + 1)
+        spill_totals += np.bincount(intervals, weights=spills.ravel(), minlength=n_events + 1)
+        shortage_hits += np.bincount(order.ravel(), weights=(post < min_restrictive).ravel(), minlength=n_events)
+        spill_counts.append(spills.sum(axis=1).astype(np.int64))
+        final_balance.append(pre[:, -1])
+
+    _, nominal_spills, _ = simulate_samples(start_time, start_value, planned_times[np.newaxis],
+                                            planned_consumptions[np.newaxis], np.array([production]),
+                                            max_restrictive, torpedo_car_volume)
+    final_balance = np.concatenate(final_balance)
+    end_time = (int(planned_times[-1]) if n_events else start_time) + ONE_HOUR_US
+    return RobustnessReport(
+        samples=samples,
+        interval_times=[from_microseconds(time) for time in planned_times.tolist() + [end_time]],
+        interval_labels=[f'{converter.cv} #{index}' for index, converter in enumerate(pig_iron_balance.converters)]
+        + ['end'],
+        spill_probability=spill_hits / samples,
+        expected_spills=spill_totals / samples,
+        shortage_probability=shortage_hits / samples,
+        nominal_spills=nominal_spills[0].astype(np.int64),
+        spill_count_distribution=np.bincount(np.concatenate(spill_counts)),
+        final_balance=final_balance,
+        final_balance_percentiles={q: float(value) for q, value in
+                                   zip(PERCENTILES, np.percentile(final_balance, PERCENTILES))},
+    )
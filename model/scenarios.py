@@ -0,0 +1,96 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+@dataclass
+class ScenarioResult:
+    """
+    One row of the scenario comparison; ``*_delta`` columns are relative to the base scenario.
+    """
+    name: str
+    resimulated_from: int
+    initial_spill_events: int
+    spill_events: int
+    final_state: float
+    hmr_uplift: float
+    fork_time: float
+    optimize_time: float
+    spill_events_delta: int = 0
+    final_state_delta: float = 0.0
+    hmr_uplift_delta: float = 0.0
+
+
+def evaluate_scenario(name: str, pig_iron_balance, delta: dict, optimize: bool = True,
+                      engine: Optional[str] = None) -> ScenarioResult:
+    """
+    Args:
+        name: scenario label
+        pig_iron_balance: base balance, left untouched
+        delta: ``PigIronBalance.fork`` arguments
+        optimize: re-optimizes the fork
+        engine: optimizer engine, defaults to the base one
+
+    Returns:
+
+    """
+    from model.optimizers import hmr_uplift
+
+    start = time.perf_counter()
+    fork = pig_iron_balance.fork(**delta)
+    fork_time = time.perf_counter() - start
+    initial_spill_events = len(fork.spill_events)
+
+    start = time.perf_counter()
+    if optimize:
+        fork.reoptimize(engine)
+    optimize_time = time.perf_counter() - start
+
+    return ScenarioResult(
+        name=name,
+        resimulated_from=fork.forked_from_index,
+        initial_spill_events=initial_spill_events,
+        spill_events=len(fork.spill_events),
+        final_state=fork.last_state.value,
+        hmr_uplift=hmr_uplift(fork),
+        fork_time=fork_time,
+        optimize_time=optimize_time,
+    )
+
+
+def compare_scenarios(pig_iron_balance, scenarios: Dict[str, dict], optimize: bool = True,
+                      engine: Optional[str] = None) -> List[ScenarioResult]:
+    """
+    Evaluates every scenario as a fork of the same base balance, which is never modified.
+
+    Args:
+        pig_iron_balance: base balance
+        scenarios: ``{name: fork arguments}``, e.g. ``{'heat 12 +20min': {'converters': {12: {'time': ...}}}}``
+        optimize: re-optimizes each scenario
+        engine: optimizer engine, defaults to the base one
+
+    Returns:
+        the base scenario first, then one row per scenario
+    """
+    base = evaluate_scenario('base', pig_iron_balance, {}, optimize, engine)
+    results = [base]
+    for name, delta in scenarios.items():
+        result = evaluate_scenario(name, pig_iron_balance, delta, optimize, engine)
+        result.spill_events_delta = result.spill_events - base.spill_events
+        result.final_state_delta = result.final_state - base.final_state
+        result.hmr_uplift_delta = result.hmr_uplift - base.hmr_uplift
+        results.append(result)
+    return results
+
+
+def comparison_table(results: List[ScenarioResult]) -> str:
+    lines = [f'{"scenario":<24}{"from":>6}{"initial":>9}{"spills":>8}{"Δ":>5}{"final":>10}{"Δ":>9}'
+             f'{"uplift":>10}{"Δ":>9}{"time [ms]":>11}']
+    for result in results:
+        lines.append(
+            f'{result.name[:23]:<24}{result.resimulated_from:>6}{result.initial_spill_events:>9}'
+            f'{result.spill_events:>8}{result.spill_events_delta:>+5}{result.final_state:>10.4f}'
+            f'{result.final_state_delta:>+9.4f}{result.hmr_uplift:>10.4f}{result.hmr_uplift_delta:>+9.4f}'
+            f'{(result.fork_time + result.optimize_time) * 1e3:>11.2f}'
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,234 @@
+"""
+Binary snapshots of solved balances.
+
+Layout: an 8 byte magic, the header length (little-endian uint64), a JSON header with the scalars and the array
+directory, then every array as raw little-endian bytes aligned to 64 bytes. Loading maps the file once and every
+array is a view over the mapping, so reopening a run costs the header parse only; the engine objects are built
+on demand by ``BalanceSnapshot.to_balance``.
+"""
+import json
+from dataclasses import asdict
+from datetime import datetime
+from typing import Dict
+
+import numpy as np
+
+from model.balance_trace import BalanceTrace
+
+MAGIC = b'PIBSNAP1'
+ALIGNMENT = 64
+VERSION = 1
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _codes(labels: list):
+    names = sorted(set(labels))
+    lookup = {name: code for code, name in enumerate(names)}
+    return names, np.array([lookup[label] for label in labels], dtype=np.int16)
+
+
+def _microseconds(times: list) -> np.ndarray:
+    return np.array(times, dtype='datetime64[us]').astype(np.int64)
+
+
+def _datetimes(microseconds: np.ndarray) -> list:
+    return microseconds.astype('datetime64[us]').tolist()
+
+
+def save_snapshot(pig_iron_balance, path: str):
+    """
+    Args:
+        pig_iron_balance: simulated balance, usually after ``optimize_hmr``
+        path: snapshot file
+
+    Returns:
+
+    """
+    trace = pig_iron_balance.balance_trace
+    converters = pig_iron_balance.converters
+    cv_names, cv_codes = _codes([converter.cv for converter in converters])
+    maintenances = pig_iron_balance.maintenances if isinstance(pig_iron_balance.maintenances, dict) else {}
+    maintenance_cvs = [cv for cv, cv_maintenances in maintenances.items() for _ in cv_maintenances]
+    maintenance_list = [maintenance for cv_maintenances in maintenances.values() for maintenance in cv_maintenances]
+    maintenance_names, maintenance_codes = _codes(maintenance_cvs)
+
+    arrays = {
+        'trace_times': trace.times,
+        'trace_values': trace.values,
+        'trace_kinds': trace.kinds,
+        'event_state_index': trace.event_state_index,
+        'converter_checkpoints': np.array(pig_iron_balance.converter_checkpoints, dtype=np.int64).reshape(-1, 2),
+        'converter_times': _microseconds([converter.time for converter in converters]),
+        'converter_hmr': np.array([converter.hmr for converter in converters], dtype=np.float64),
+        'converter_cv': cv_codes,
+        'spill_times': _microseconds([spill.time for spill in pig_iron_balance.spill_events]),
+        'maintenance_times': _microseconds([maintenance.time for maintenance in maintenance_list]),
+        'maintenance_durations': np.array([maintenance.duration for maintenance in maintenance_list],
+                                          dtype=np.float64),
+        'maintenance_cv': maintenance_codes,
+    }
+
+    directory = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+        arrays[name] = array
+        directory[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _aligned(offset + array.nbytes)
+
+    report = pig_iron_balance.optimizer_report
+    header = json.dumps({
+        'version': VERSION,
+        'arrays': directory,
+        'cv_names': cv_names,
+        'maintenance_names': maintenance_names,
+        'initial_conditions': {'time': pig_iron_balance.initial_conditions.time.isoformat(),
+                               'value': pig_iron_balance.initial_conditions.value},
+        'units_base': pig_iron_balance.units.base,
+        'pig_iron_hourly_production': pig_iron_balance.pig_iron_hourly_production,
+        'max_restrictive': pig_iron_balance.max_restrictive,
+        'min_restrictive': pig_iron_balance.min_restrictive,
+        'k': pig_iron_balance.k,
+        'min_hmr': pig_iron_balance.min_hmr,
+        'max_hmr': pig_iron_balance.max_hmr,
+        'allow_auto_spill_events': pig_iron_balance.allow_auto_spill_events,
+        'optimize': pig_iron_balance.optimize,
+        'simulation_mode': pig_iron_balance.simulation_mode,
+        'optimizer_engine': pig_iron_balance.optimizer_engine,
+        'total_cost': pig_iron_balance.total_cost,
+        'initial_spill_events': pig_iron_balance.initial_spill_events,
+        'initial_spill_count': pig_iron_balance.initial_spill_count,
+        'committed_converters': pig_iron_balance.committed_converters,
+        'liquid_profit_dict': list(pig_iron_balance.liquid_profit_dict.items()),
+        'optimizer_report': asdict(report) if report is not None else None,
+    }, default=float).encode()
+
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+    with open(path, 'wb') as snapshot_file:
+        snapshot_file.write(MAGIC)
+        snapshot_file.write(np.uint64(len(header)).astype('<u8').tobytes())
+        snapshot_file.write(header)
+        for name, array in arrays.items():
+            snapshot_file.seek(data_start + directory[name]['offset'])
+            snapshot_file.write(array.tobytes())
+        # pad so the last array never ends past the mapped file
+        snapshot_file.truncate(data_start + offset)
+
+
+class BalanceSnapshot:
+    """
+    A loaded snapshot: ``metadata`` holds the scalars, ``arrays`` read-only views over the file.
+    """
+
+    def __init__(self, metadata: dict, arrays: Dict[str, np.ndarray]):
+        self.metadata = metadata
+        self.arrays = arrays
+
+    @property
+    def final_state(self) -> float:
+        return float(self.arrays['trace_values'][-1])
+
+    @property
+    def spill_count(self) -> int:
+        return len(self.arrays['spill_times'])
+
+    @property
+    def balance_trace(self) -> BalanceTrace:
+        """
+        Returns:
+            the balance over the file's memory, copied only if written to
+        """
+        trace = BalanceTrace.__new__(BalanceTrace)
+        trace._times = self.arrays['trace_times']
+        trace._values = self.arrays['trace_values']
+        trace._kinds = self.arrays['trace_kinds']
+        trace._event_state_index = self.arrays['event_state_index']
+        trace._length = len(trace._times)
+        trace._n_events = len(trace._event_state_index)
+        trace._shared = True
+        return trace
+
+    def to_balance(self):
+        """
+        Returns:
+            a ``PigIronBalance`` ready to be plotted, compared, forked or re-optimized
+        """
+        from model.optimizers import OptimizationReport
+        from model.pig_iron_balance import (Converter, Maintenance, PigIronBalance, PigIronBalanceState,
+                                            PigIronTippingEvent)
+
+        metadata, arrays = self.metadata, self.arrays
+        cv_names = metadata['cv_names']
+        converters = [
+            Converter.construct(time=time, hmr=hmr, cv=cv_names[cv], index=index)
+            for index, (time, hmr, cv) in enumerate(zip(_datetimes(arrays['converter_times']),
+                                                        arrays['converter_hmr'].tolist(),
+                                                        arrays['converter_cv'].tolist()))
+        ]
+        maintenances = {name: [] for name in metadata['maintenance_names']}
+        for time, duration, cv in zip(_datetimes(arrays['maintenance_times']),
+                                      arrays['maintenance_durations'].tolist(), arrays['maintenance_cv'].tolist()):
+            maintenances[metadata['maintenance_names'][cv]].append(Maintenance.construct(time=time,
+                                                                                         duration=duration))
+        initial = metadata['initial_conditions']
+
+        pig_iron_balance = PigIronBalance(
+            initial_conditions=PigIronBalanceState.construct(time=datetime.fromisoformat(initial['time']), value=0.0),
+            pig_iron_hourly_production=0.0,
+            converters=converters,
+            spill_events=[PigIronTippingEvent.construct(time=time) for time in _datetimes(arrays['spill_times'])],
+            max_restrictive=0.0,
+            allow_auto_spill_events=metadata['allow_auto_spill_events'],
+            maintenances=maintenances,
+            optimize=metadata['optimize'],
+            simulation_mode=metadata['simulation_mode'],
+            optimizer_engine=metadata['optimizer_engine'],
+        )
+        # the snapshot already holds p.u. values, restore them as they were instead of normalizing again
+        pig_iron_balance.initial_conditions.value = initial['value']
+        for name in ('pig_iron_hourly_production', 'max_restrictive', 'min_restrictive', 'k', 'min_hmr', 'max_hmr',
+                     'total_cost', 'initial_spill_events', 'initial_spill_count', 'committed_converters'):
+            setattr(pig_iron_balance, name, metadata[name])
+        pig_iron_balance.balance_trace = self.balance_trace
+        pig_iron_balance.converter_checkpoints = [tuple(checkpoint) for checkpoint in
+                                                  arrays['converter_checkpoints'].tolist()]
+        pig_iron_balance.liquid_profit_dict = {int(key): value for key, value in metadata['liquid_profit_dict']}
+        if metadata['optimizer_report'] is not None:
+            pig_iron_balance.optimizer_report = OptimizationReport(**metadata['optimizer_report'])
+        pig_iron_balance.invalidate()
+        return pig_iron_balance
+
+
+def load_snapshot(path: str, mmap: bool = True) -> BalanceSnapshot:
+    """
+    Args:
+        path: snapshot file
+        mmap: maps the file instead of reading it
+
+    Returns:
+
+    """
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        with open(path, 'rb') as snapshot_file:
+            buffer = np.frombuffer(snapshot_file.read(), dtype=np.uint8)
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f'{path} is not a pig iron balance snapshot')
+    header_length = int(buffer[len(MAGIC):len(MAGIC) + 8].view('<u8')[0])
+    header_start = len(MAGIC) + 8
+    metadata = json.loads(bytes(buffer[header_start:header_start + header_length]))
+    if metadata['version'] != VERSION:
+        raise ValueError(f'Unsupported snapshot version {metadata["version"]}')
+
+    data_start = _aligned(header_start + header_length)
+    arrays = {}
+    for name, entry in metadata.pop('arrays').items():
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        start = data_start + entry['offset']
+        arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(entry['shape'])
+    return BalanceSnapshot(metadata, arrays)
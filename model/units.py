@@ -0,0 +1,18 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class UnitSystem:
+    """
+    Per-unit system of the balance: one p.u. is one torpedo car (``base`` tonnes).
+
+    Inputs are normalized once, when the balance is built; the engine then runs natively in p.u. and values are
+    converted back only at the output boundaries.
+    """
+    base: float
+
+    def to_pu(self, value: float) -> float:
+        return value / self.base
+
+    def from_pu(self, value: float) -> float:
+        return value * self.base
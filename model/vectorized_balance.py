@@ -0,0 +1,259 @@
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from model.balance_trace import BalanceStateKind, ONE_HOUR_US, ONE_MICROSECOND, ONE_SECOND_US, to_microseconds
+
+# Events are evaluated in blocks: a block without a crossing doubles the next one, a spill resets it
+MIN_BLOCK = 32
+MAX_BLOCK = 4096
+
+
+@dataclass
+class SimulatedSegment:
+    """
+    Balance states produced by ``simulate_segment``, stored column-wise.
+
+    ``checkpoints[j]`` holds the number of states and spill events emitted before event ``j`` was simulated (the
+    last row, before the end of simulation) and ``event_state_index[j]`` the position of its pre-event state, both
+    relative to the segment.
+    """
+    times: np.ndarray
+    values: np.ndarray
+    kinds: np.ndarray
+    spill_times: np.ndarray
+    checkpoints: np.ndarray
+    event_state_index: np.ndarray
+
+
+class _SegmentBuilder:
+
+    def __init__(self, n_events: int):
+        self.times: List[np.ndarray] = []
+        self.values: List[np.ndarray] = []
+        self.kinds: List[np.ndarray] = []
+        self.spill_times: List[int] = []
+        self.length = 0
+        self.checkpoints = np.empty((n_events + 1, 2), dtype=np.int64)
+        self.event_state_index = np.empty(n_events, dtype=np.int64)
+
+    def extend(self, times: np.ndarray, values: np.ndarray, kinds: np.ndarray):
+        self.times.append(times)
+        self.values.append(values)
+        self.kinds.append(kinds)
+        self.length += len(times)
+
+    def append(self, time: int, value: float, kind: BalanceStateKind):
+        self.extend(np.array([time], dtype=np.int64), np.array([value], dtype=np.float64),
+                    np.array([kind], dtype=np.int8))
+
+    def build(self) -> SimulatedSegment:
+        return SimulatedSegment(
+            times=np.concatenate(self.times) if self.times else np.empty(0, dtype=np.int64),
+            values=np.concatenate(self.values) if self.values else np.empty(0, dtype=np.float64),
+            kinds=np.concatenate(self.kinds) if self.kinds else np.empty(0, dtype=np.int8),
+            spill_times=np.array(self.spill_times, dtype=np.int64),
+            checkpoints=self.checkpoints,
+            event_state_index=self.event_state_index,
+        )
+
+
+def spill_chain(previous_time: int, previous_value: float, event_time: int, next_value: float, production: float,
+                max_restrictive: float, torpedo_car_volume: float) -> Tuple[np.ndarray, float]:
+    """
+    Closed form of the spill loop of ``PigIronBalance.get_next_value``.
+
+    After the first tipping every spill starts from the same post-spill value, so the spills of an interval are
+    evenly spaced by one second plus the time production takes to refill a torpedo car. Their times and the balance
+    each one leaves at ``event_time`` come out of a single ``np.arange``, computed with the same floating point
+    operations as the loop, so both agree to the bit. Only the values within rounding distance of
+    ``max_restrictive`` go through ``round`` one by one.
+
+    Args:
+        previous_time: time of the last state, in microseconds since epoch
+        previous_value: value of the last state
+        event_time: time of the next state, in microseconds since epoch
+        next_value: value of the next state without spills
+        production: pig iron hourly production
+        max_restrictive:
+        torpedo_car_volume:
+
+    Returns:
+        spill times, in microseconds since epoch, and the balance value at ``event_time``
+    """
+    if round(next_value, 7) <= max_restrictive:
+        return np.empty(0, dtype=np.int64), next_value
+
+    post_spill_value = max_restrictive - torpedo_car_volume + production / 3600
+    if post_spill_value >= max_restrictive:
+        raise ValueError('torpedo_car_volume must exceed one second of pig iron production')
+
+    first_spill = previous_time + timedelta(
+        minutes=(max_restrictive - previous_value) * 60 / production
+    ) // ONE_MICROSECOND
+    period = ONE_SECOND_US + timedelta(
+        minutes=(max_restrictive - post_spill_value) * 60 / production
+    ) // ONE_MICROSECOND
+
+    # the last candidate lies past event_time, so its value is under post_spill_value and ends the chain
+    count = max((event_time - first_spill) // period + 2, 1)
+    spill_times = first_spill + period * np.arange(count, dtype=np.int64)
+    values = post_spill_value + production * ((event_time - spill_times) / ONE_SECOND_US / 3600)
+
+    # values only decrease; rounding to 7 decimals moves them by less than 1e-6
+    last = int(np.argmax(values <= max_restrictive + 1e-6))
+    while round(float(values[last]), 7) > max_restrictive:
+        last += 1
+    return spill_times[:last + 1], float(values[last])
+
+
+def spill_states(spill_times: np.ndarray, production: float, max_restrictive: float,
+                 torpedo_car_volume: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns:
+        times, values and kinds of the SPILL / POST_SPILL state pairs of ``spill_times``
+    """
+    count = len(spill_times)
+    times = np.empty(2 * count, dtype=np.int64)
+    times[0::2] = spill_times
+    times[1::2] = spill_times + ONE_SECOND_US
+    values = np.empty(2 * count, dtype=np.float64)
+    values[0::2] = max_restrictive
+    values[1::2] = max_restrictive - torpedo_car_volume + production / 3600
+    kinds = np.empty(2 * count, dtype=np.int8)
+    kinds[0::2] = BalanceStateKind.SPILL
+    kinds[1::2] = BalanceStateKind.POST_SPILL
+    return times, values, kinds
+
+
+def _resolve_spills(builder: _SegmentBuilder, previous_time: int, previous_value: float, event_time: int,
+                    next_value: float, production: float, max_restrictive: float,
+                    torpedo_car_volume: float) -> float:
+    """
+    Tips torpedo cars until the balance at ``event_time`` is back under ``max_restrictive``.
+
+    Returns:
+        balance value right before the event
+    """
+    spill_times, next_value = spill_chain(previous_time, previous_value, event_time, next_value, production,
+                                          max_restrictive, torpedo_car_volume)
+    if len(spill_times):
+        builder.extend(*spill_states(spill_times, production, max_restrictive, torpedo_car_volume))
+        builder.spill_times.extend(spill_times.tolist())
+    return next_value
+
+
+def simulate_segment(start_time: int, start_value: float, event_times: np.ndarray, consumptions: np.ndarray,
+                     production: float, max_restrictive: float, torpedo_car_volume: float,
+                     allow_auto_spill_events: bool, last_event_time: Optional[int] = None) -> SimulatedSegment:
+    """
+    Simulates the balance from a known state through a sorted list of converter events and the end of simulation.
+
+    Between spills the balance is a cumulative sum, so events are evaluated a block at a time: the pre-event values
+    of the block come from one ``np.cumsum`` and the first crossing of ``max_restrictive`` is found with a vectorized
+    search. Only the spill itself is resolved in Python, after which the sweep continues from the spilled event.
+
+    Args:
+        start_time: time of the last known state, in microseconds since epoch
+        start_value: value of the last known state
+        event_times: converter times, in microseconds since epoch
+        consumptions: pig iron consumed by each converter (``hmr * k``)
+        production: pig iron hourly production
+        max_restrictive:
+        torpedo_car_volume:
+        allow_auto_spill_events:
+        last_event_time: time of the last converter or spill already simulated, ``start_time`` by default; the end of
+            simulation is one hour after the last event, which may precede the start (e.g. restarting from the
+            post-event state of the last converter)
+
+    Returns:
+        the simulated states, excluding the starting one
+    """
+    n_events = len(event_times)
+    per_second = production / 3600
+    builder = _SegmentBuilder(n_events)
+    last_time, last_value = start_time, start_value
+
+    k = 0
+    block = MIN_BLOCK
+    while k < n_events:
+        stop = min(n_events, k + block)
+        times = event_times[k:stop]
+        consumed = consumptions[k:stop]
+
+        pre = np.empty(stop - k, dtype=np.float64)
+        pre[0] = last_value + production * ((times[0] - last_time) / ONE_SECOND_US / 3600)
+        pre[1:] = pre[0] + production * ((times[1:] - times[0]) / ONE_SECOND_US / 3600) - np.cumsum(consumed[:-1])
+
+        crossings = np.flatnonzero(np.round(pre, 7) > max_restrictive) if allow_auto_spill_events else ()
+        count = crossings[0] if len(crossings) else stop - k
+
+        if count:
+            post = pre[:count] - consumed[:count] + per_second
+            chunk_times = np.empty(2 * count, dtype=np.int64)
+            chunk_times[0::2] = times[:count]
+            chunk_times[1::2] = times[:count] + ONE_SECOND_US
+            chunk_values = np.empty(2 * count, dtype=np.float64)
+            chunk_values[0::2] = pre[:count]
+            chunk_values[1::2] = post
+            chunk_kinds = np.empty(2 * count, dtype=np.int8)
+            chunk_kinds[0::2] = BalanceStateKind.PRE_EVENT
+            chunk_kinds[1::2] = BalanceStateKind.POST_EVENT
+
+            state_index = builder.length + 2 * np.arange(count)
+            builder.checkpoints[k:k + count, 0] = state_index
+            builder.checkpoints[k:k + count, 1] = len(builder.spill_times)
+            builder.event_state_index[k:k + count] = state_index
+            builder.extend(chunk_times, chunk_values, chunk_kinds)
+
+            last_time, last_value = int(chunk_times[-1]), float(post[-1])
+            k += count
+
+        if len(crossings):
+            event_time = int(event_times[k])
+            builder.checkpoints[k] = (builder.length, len(builder.spill_times))
+            next_value = _resolve_spills(builder, last_time, last_value, event_time,
+                                         float(pre[count]), production, max_restrictive, torpedo_car_volume)
+            builder.event_state_index[k] = builder.length
+            post_value = next_value - float(consumptions[k]) + per_second
+            builder.append(event_time, next_value, BalanceStateKind.PRE_EVENT)
+            builder.append(event_time + ONE_SECOND_US, post_value, BalanceStateKind.POST_EVENT)
+
+            last_time, last_value = event_time + ONE_SECOND_US, post_value
+            k += 1
+            block = MIN_BLOCK
+        else:
+            block = min(2 * block, MAX_BLOCK)
+
+    builder.checkpoints[n_events] = (builder.length, len(builder.spill_times))
+    end_time = int(event_times[-1]) if n_events else (start_time if last_event_time is None else last_event_time)
+    if builder.spill_times:
+        end_time = max(end_time, builder.spill_times[-1])
+    end_time += ONE_HOUR_US
+    next_value = last_value + production * ((end_time - last_time) / ONE_SECOND_US / 3600)
+    if allow_auto_spill_events:
+        next_value = _resolve_spills(builder, last_time, last_value, end_time, next_value,
+                                     production, max_restrictive, torpedo_car_volume)
+    builder.append(end_time, next_value, BalanceStateKind.END)
+    return builder.build()
+
+
+def converter_arrays(converters: list, k: float, maintenance_index=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Args:
+        converters: converters sorted by time
+        k: pig iron consumed by a converter at hmr 1
+        maintenance_index: converters blocked by a maintenance consume nothing
+
+    Returns:
+        converter times in microseconds since epoch and pig iron consumed by each one
+    """
+    times = np.fromiter((to_microseconds(converter.time) for converter in converters), dtype=np.int64,
+                        count=len(converters))
+    consumptions = np.fromiter((converter.hmr * k for converter in converters), dtype=np.float64,
+                               count=len(converters))
+    if maintenance_index:
+        consumptions[[maintenance_index.is_blocked(converter) for converter in converters]] = 0
+    return times, consumptions
@@ -0,0 +1,14 @@
+import json
+import os
+
+import pytest
+
+TEST_CASES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test_cases')
+
+
+@pytest.fixture
+def load_case():
+    def load(ct_name: str) -> dict:
+        with open(os.path.join(TEST_CASES, f'{ct_name}.json')) as json_file:
+            return json.load(json_file)
+    return load
@@ -0,0 +1,14 @@
+import pickle
+
+from utils.model_generator import pig_iron_balance_model
+
+
+def test_optimized_balance_pickles(load_case):
+    # batch plotting ships solved balances from the solver processes to the plotting ones
+    pig_iron_balance = pig_iron_balance_model(load_case('ct3.1'))
+    pig_iron_balance.optimize_hmr()
+
+    restored = pickle.loads(pickle.dumps(pig_iron_balance))
+
+    assert restored.last_state.value == pig_iron_balance.last_state.value
+    assert restored.instrumentation.iteration_table() == pig_iron_balance.instrumentation.iteration_table()
@@ -0,0 +1,12 @@
+from utils.model_generator import pig_iron_balance_model
+
+
+def test_blocked_converters_stay_out_of_cache_stats(load_case):
+    pig_iron_balance = pig_iron_balance_model(load_case('ct3.1'))
+    pig_iron_balance.generate_pig_iron_balance()
+    before = pig_iron_balance.cache_stats
+
+    pig_iron_balance.blocked_converters
+    pig_iron_balance.blocked_converters
+
+    assert pig_iron_balance.cache_stats == before
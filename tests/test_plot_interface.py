@@ -0,0 +1,11 @@
+from types import SimpleNamespace
+
+from utils.plot_interface import SCALABLE_EVENTS, is_scalable
+
+
+def test_scalable_counts_maintenance_windows():
+    windows = [object()] * (SCALABLE_EVENTS + 1)
+    pig_iron_balance = SimpleNamespace(converters=[], spill_events=[], maintenances={'CV 1': windows, 'CV 2': []})
+
+    assert is_scalable(pig_iron_balance)
+    assert not is_scalable(pig_iron_balance, scalable=False)
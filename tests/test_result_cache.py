@@ -0,0 +1,12 @@
+from utils.result_cache import ResultCache
+
+
+def test_second_solve_is_a_hit(load_case, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    solved = cache.solve(load_case('ct3.1'))
+
+    cached = cache.solve(load_case('ct3.1'))
+
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+    assert cached.last_state.value == solved.last_state.value
+    assert len(cached.spill_events) == len(solved.spill_events)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from model.robustness import evaluate_plan, simulate_samples
+from model.vectorized_balance import converter_arrays
+from utils.model_generator import pig_iron_balance_model
+
+
+def test_spills_are_counted_per_planned_converter(load_case):
+    pig_iron_balance = pig_iron_balance_model(load_case('ct8.1'))
+    pig_iron_balance.generate_pig_iron_balance()
+    samples, seed = 50, 7
+    # a large jitter reorders converters in most samples
+    report = evaluate_plan(pig_iron_balance, samples=samples, delay_std_minutes=60.0, seed=seed)
+
+    # same draws, attributed one sample and one column at a time
+    times, consumptions = converter_arrays(pig_iron_balance.converters, pig_iron_balance.k,
+                                           pig_iron_balance.maintenance_index)
+    rng = np.random.default_rng(seed)
+    production = pig_iron_balance.pig_iron_hourly_production * (1 + 0.03 * rng.standard_normal(samples))
+    delays = 60.0 * rng.standard_normal((samples, len(times)))
+    sampled_times = times + np.round(delays * 60e6).astype(np.int64)
+    order = np.argsort(sampled_times, axis=1, kind='stable')
+    _, spills, _ = simulate_samples(int(pig_iron_balance.balance_trace.times[0]),
+                                    float(pig_iron_balance.balance_trace.values[0]),
+                                    np.take_along_axis(sampled_times, order, axis=1), consumptions[order],
+                                    np.maximum(production, 0.0), pig_iron_balance.max_restrictive,
+                                    pig_iron_balance.pig_iron_constants.torpedo_car_volume)
+    expected = np.zeros(len(times) + 1)
+    for sample in range(samples):
+        for column, converter in enumerate(order[sample].tolist() + [len(times)]):
+            expected[converter] += spills[sample, column]
+
+    assert np.any(order != np.arange(len(times)))
+    assert report.expected_spills == pytest.approx(expected / samples)
+    assert len(report.interval_labels) == len(report.interval_times)
+
+
+def test_evaluate_plan_needs_samples(load_case):
+    pig_iron_balance = pig_iron_balance_model(load_case('ct2'))
+
+    with pytest.raises(ValueError, match='at least one sample'):
+        evaluate_plan(pig_iron_balance, samples=0)
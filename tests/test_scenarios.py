@@ -0,0 +1,28 @@
+import pytest
+
+from model.scenarios import compare_scenarios
+from utils.model_generator import pig_iron_balance_model
+
+
+@pytest.mark.parametrize('simulation_mode', ['python', 'numpy'])
+@pytest.mark.parametrize('ct_name', ['ct2', 'ct8.1'])
+def test_fork_without_changes_equals_base(load_case, ct_name, simulation_mode):
+    pig_iron_balance = pig_iron_balance_model({**load_case(ct_name), 'simulation_mode': simulation_mode})
+    pig_iron_balance.generate_pig_iron_balance()
+
+    fork = pig_iron_balance.fork()
+
+    assert fork.balance_trace.times.tolist() == pig_iron_balance.balance_trace.times.tolist()
+    assert fork.balance_trace.values.tolist() == pytest.approx(pig_iron_balance.balance_trace.values.tolist())
+    assert len(fork.spill_events) == len(pig_iron_balance.spill_events)
+
+
+@pytest.mark.parametrize('simulation_mode', ['python', 'numpy'])
+def test_base_scenario_matches_engine(load_case, simulation_mode):
+    input_data = {**load_case('ct2'), 'simulation_mode': simulation_mode}
+    reference = pig_iron_balance_model({**input_data, 'simulation_mode': 'python'})
+    reference.generate_pig_iron_balance()
+
+    base = compare_scenarios(pig_iron_balance_model(input_data), {}, optimize=False)[0]
+
+    assert base.final_state == pytest.approx(reference.last_state.value)
@@ -0,0 +1,84 @@
+"""
+The closed-form spills, the columnar trace, checkpointed re-simulation, the numpy mode and the columnar loader must
+all reproduce the original per-event simulation.
+"""
+import numpy as np
+import pytest
+
+from utils.columnar_loader import columnar_input, pig_iron_balance_from_columns
+from utils.model_generator import pig_iron_balance_model
+
+CASES = ('ct2', 'ct8.1')
+MODES = ('python', 'numpy')
+# (states, spill events, final state, sum of the states) of the original object-based engine
+BASELINE = {
+    ('ct2', False): (22, 2, 5.600833333333334, 103.46333333333337),
+    ('ct2', True): (20, 1, 5.800416666666667, 95.05749999999999),
+    ('ct8.1', False): (1012, 61, 6.511550000900008, 5886.757856211399),
+    ('ct8.1', True): (954, 32, 6.9743333333722095, 5153.027761170538),
+}
+
+
+def simulated(input_data, simulation_mode, optimize=False):
+    pig_iron_balance = pig_iron_balance_model({**input_data, 'simulation_mode': simulation_mode})
+    if optimize:
+        pig_iron_balance.optimize = True
+        pig_iron_balance.optimize_hmr(engine='greedy')
+    else:
+        pig_iron_balance.generate_pig_iron_balance()
+    return pig_iron_balance
+
+
+def assert_same_balance(balance, reference):
+    assert balance.balance_trace.times.tolist() == reference.balance_trace.times.tolist()
+    assert balance.balance_trace.kinds.tolist() == reference.balance_trace.kinds.tolist()
+    np.testing.assert_allclose(balance.balance_trace.values, reference.balance_trace.values, rtol=1e-12, atol=1e-9)
+    assert [spill.time for spill in balance.spill_events] == [spill.time for spill in reference.spill_events]
+
+
+@pytest.mark.parametrize('optimize', [False, True])
+@pytest.mark.parametrize('simulation_mode', MODES)
+@pytest.mark.parametrize('ct_name', CASES)
+def test_matches_original_engine(load_case, ct_name, simulation_mode, optimize):
+    pig_iron_balance = simulated(load_case(ct_name), simulation_mode, optimize)
+    states, spills, final_state, total = BASELINE[ct_name, optimize]
+
+    assert len(pig_iron_balance.balance_trace) == states
+    assert len(pig_iron_balance.spill_events) == spills
+    assert pig_iron_balance.last_state.value == pytest.approx(final_state, rel=1e-12)
+    assert float(pig_iron_balance.balance_trace.values.sum()) == pytest.approx(total, rel=1e-12)
+
+
+@pytest.mark.parametrize('ct_name', CASES)
+def test_numpy_mode_matches_python_mode(load_case, ct_name):
+    input_data = load_case(ct_name)
+
+    assert_same_balance(simulated(input_data, 'numpy'), simulated(input_data, 'python'))
+
+
+@pytest.mark.parametrize('simulation_mode', MODES)
+@pytest.mark.parametrize('ct_name', CASES)
+def test_columnar_loader_matches_model(load_case, ct_name, simulation_mode):
+    input_data = {**load_case(ct_name), 'simulation_mode': simulation_mode}
+    pig_iron_balance = pig_iron_balance_from_columns(columnar_input(input_data))
+    pig_iron_balance.generate_pig_iron_balance()
+
+    assert_same_balance(pig_iron_balance, simulated(input_data, simulation_mode))
+
+
+@pytest.mark.parametrize('simulation_mode', MODES)
+@pytest.mark.parametrize('ct_name', CASES)
+def test_fork_matches_full_simulation(load_case, ct_name, simulation_mode):
+    pig_iron_balance = simulated(load_case(ct_name), simulation_mode)
+    index = len(pig_iron_balance.converters) // 2
+
+    fork = pig_iron_balance.fork(converters={index: {'hmr': 0.95}})
+    times, values = fork.balance_trace.times.copy(), fork.balance_trace.values.copy()
+    spill_times = [spill.time for spill in fork.spill_events]
+    fork.generate_pig_iron_balance()
+
+    assert times.tolist() == fork.balance_trace.times.tolist()
+    np.testing.assert_allclose(values, fork.balance_trace.values, rtol=1e-12, atol=1e-9)
+    assert spill_times == [spill.time for spill in fork.spill_events]
+    # the base balance is left untouched
+    assert_same_balance(pig_iron_balance, simulated(load_case(ct_name), simulation_mode))
@@ -1,56 +1,49 @@
 import json
-import os
 import random
 from datetime import datetime, timedelta
 
-from model.pig_iron_balance import Maintenance
+from model.maintenance_index import MaintenanceIndex
 
 
-def check_overlap(tuple1, tuple2):
-    start1, end1 = tuple1
-    start2, end2 = tuple2
+def generate_test_case(ct_name, days=30, seed=None, save=True):
+    """
+    Generates a random two-converter test case.
 
-    # Check if the intervals overlap
-    if start1 <= end2 and start2 <= end1:
-        return True  # Overlap exists
-    else:
-        return False  # No overlap
+    Args:
+        ct_name: name of the test case file
+        days: simulated horizon
+        seed: makes the case reproducible (used by the benchmarks)
+        save: writes test_cases/<ct_name>.json
 
-
-def generate_test_case(ct_name):
-    filename = f'test_cases/{ct_name}.json'
-    # if os.path.exists(filename):
-    #     print('Skiping test case generation!')
-    #     return None
+    Returns:
+        the test case input data
+    """
+    rng = random.Random(seed)
     # Define the start and end time for the day
     start_time = datetime(2023, 6, 1, 0, 0, 0)
-    end_time = datetime(2023, 7, 1, 0, 0, 0)
+    end_time = start_time + timedelta(days=days)
 
     # Define the time interval range between converters (1 hour to 1 hour 15 minutes)
     min_interval = timedelta(hours=1)
     max_interval = timedelta(hours=1, minutes=220)
 
-    # Generate random converter start times
-    converter_start_times = []
-    current_time = start_time + timedelta(minutes=random.randint(50, 80))
+    current_time = start_time + timedelta(minutes=rng.randint(50, 80))
 
     maintenances_cv1 = [{'time': (start_time.replace(second=0) + timedelta(days=5)).isoformat(), 'duration': 7*24}]
     # maintenances_cv1 = []
+    maintenance_index = MaintenanceIndex()
+    for maintenance in maintenances_cv1:
+        start_maintenance = datetime.fromisoformat(maintenance['time'])
+        maintenance_index.add('CV 1', start_maintenance, start_maintenance + timedelta(hours=maintenance['duration']))
     converters_1 = []
     while current_time < end_time:
         # Generate a random start time for the converter
         converter_start = current_time
-        interval = random.randint(min_interval.total_seconds(), max_interval.total_seconds())
+        interval = rng.randint(int(min_interval.total_seconds()), int(max_interval.total_seconds()))
         current_time += timedelta(seconds=interval)
 
         # Check if the converter start time overlaps with any maintenance duration
-        overlap = False
-        for maintenance in maintenances_cv1:
-            start_maintenance = datetime.fromisoformat(maintenance['time'])
-            end_maintenance = start_maintenance + timedelta(hours=maintenance['duration'])
-            if converter_start <= end_maintenance and start_maintenance <= current_time:
-                overlap = True
-                break
+        overlap = maintenance_index.overlaps('CV 1', converter_start, current_time)
 
         # Add the converter to the list only if there is no overlap with maintenance
         if not overlap:
@@ -64,23 +57,19 @@ def generate_test_case(ct_name):
     start_time = datetime(2023, 6, 1, 0, 0, 0)
     maintenances_cv2 = [{'time': (start_time.replace(second=0) + timedelta(hours=72)).isoformat(), 'duration': 24}]
     maintenances_cv2 = []
-    converter_start_times_2 = []
-    current_time = start_time + timedelta(minutes=random.randint(80, 95))
+    for maintenance in maintenances_cv2:
+        start_maintenance = datetime.fromisoformat(maintenance['time'])
+        maintenance_index.add('CV 2', start_maintenance, start_maintenance + timedelta(hours=maintenance['duration']))
+    current_time = start_time + timedelta(minutes=rng.randint(80, 95))
     converters_2 = []
     while current_time < end_time:
         # Generate a random start time for the converter
         converter_start = current_time
-        interval = random.randint(min_interval.total_seconds(), max_interval.total_seconds())
+        interval = rng.randint(int(min_interval.total_seconds()), int(max_interval.total_seconds()))
         current_time += timedelta(seconds=interval)
 
         # Check if the converter start time overlaps with any maintenance duration
-        overlap = False
-        for maintenance in maintenances_cv2:
-            start_maintenance = datetime.fromisoformat(maintenance['time'])
-            end_maintenance = start_maintenance + timedelta(hours=maintenance['duration'])
-            if converter_start <= end_maintenance and start_maintenance <= current_time:
-                overlap = True
-                break
+        overlap = maintenance_index.overlaps('CV 2', converter_start, current_time)
 
         # Add the converter to the list only if there is no overlap with maintenance
         if not overlap:
@@ -110,11 +99,13 @@ def generate_test_case(ct_name):
         "maintenances_cv1": maintenances_cv1,
         "maintenances_cv2": maintenances_cv2
     }
+    if not save:
+        return test_case
+
     # Save the data to a JSON file
     filename = f'test_cases/{ct_name}.json'
-    # if os.path.exists(filename):
-    #     raise Exception('Test case already exist')
     with open(filename, 'w') as file:
         json.dump(test_case, file, indent=4)
 
     print(f"JSON data has been saved to {filename}.")
+    return test_case
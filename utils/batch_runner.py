@@ -0,0 +1,174 @@
+"""
+Solves every test case of a directory in parallel.
+
+Run from the repository root:
+    python -m utils.batch_runner [directory] [--workers N] [--plot] [--engine greedy|lp|milp] [--cache DIR]
+
+which is ``python main.py batch`` with plots off unless ``--plot`` is given.
+"""
+import os
+import sys
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from utils.columnar_loader import load_columnar, pig_iron_balance_from_columns
+from utils.result_cache import DEFAULT_MAX_BYTES, ResultCache
+
+
+@dataclass
+class CaseResult:
+    ct_name: str
+    initial_spill_events: int
+    final_spill_events: int
+    final_state: float
+    liquid_profit_dict: Dict
+    wall_time: float
+    engine: str = 'greedy'
+    error: Optional[str] = None
+    plot_time: Optional[float] = None
+    plot_error: Optional[str] = None
+    cached: bool = False
+    # solved PigIronBalance, only kept when it has to be shipped to a plotting worker
+    pig_iron_balance: object = field(default=None, repr=False)
+
+
+def list_cases(directory: str, exclude: Iterable[str] = ()) -> List[str]:
+    cases = []
+    for filename in sorted(os.listdir(directory)):
+        file_path = os.path.join(directory, filename)
+        if os.path.isfile(file_path) and filename.endswith('.json'):
+            if filename.split('.json')[0] not in exclude:
+                cases.append(file_path)
+    return cases
+
+
+def solve_case(file_path: str, engine: Optional[str] = None, keep_balance: bool = False,
+               cache_directory: Optional[str] = None, cache_max_bytes: int = DEFAULT_MAX_BYTES,
+               simulation_mode: Optional[str] = None) -> CaseResult:
+    """
+    Loads, simulates and optimizes one case. Runs inside the worker processes, so it must stay importable.
+
+    Args:
+        file_path: case JSON file
+        engine: optimizer backend, defaults to the one of the input file
+        keep_balance: returns the solved PigIronBalance along with the result (for plotting)
+        cache_directory: result cache (see ``utils.result_cache``), none by default
+        cache_max_bytes: size bound of the result cache
+        simulation_mode: overrides the one of the input file
+
+    Returns:
+
+    """
+    ct_name = os.path.basename(file_path).split('.json')[0]
+    start = time.perf_counter()
+    cached = False
+    try:
+        columns = load_columnar(file_path)
+        if cache_directory:
+            cache = ResultCache(cache_directory, cache_max_bytes)
+            pig_iron_balance = cache.solve(columns, engine, simulation_mode)
+            cached = cache.stats.hits > 0
+        else:
+            pig_iron_balance = pig_iron_balance_from_columns(columns, simulation_mode=simulation_mode)
+            pig_iron_balance.optimize_hmr(engine=engine)
+    except Exception as error:
+        return CaseResult(ct_name=ct_name, initial_spill_events=-1, final_spill_events=-1, final_state=float('nan'),
+                          liquid_profit_dict={}, wall_time=time.perf_counter() - start, error=repr(error))
+
+    return CaseResult(
+        ct_name=ct_name,
+        initial_spill_events=pig_iron_balance.initial_spill_count,
+        final_spill_events=len(pig_iron_balance.spill_events),
+        final_state=pig_iron_balance.last_state.value,
+        liquid_profit_dict=dict(pig_iron_balance.liquid_profit_dict),
+        wall_time=time.perf_counter() - start,
+        engine=pig_iron_balance.optimizer_report.engine if pig_iron_balance.optimizer_report else 'none',
+        cached=cached,
+        pig_iron_balance=pig_iron_balance if keep_balance else None,
+    )
+
+
+def plot_case(ct_name: str, pig_iron_balance, format: str = 'png') -> float:
+    from utils.plot_interface import plot_interface
+
+    start = time.perf_counter()
+    plot_interface(ct_name, pig_iron_balance, debug=False, format=format)
+    return time.perf_counter() - start
+
+
+def run_batch(directory: str = 'test_cases', workers: Optional[int] = None, plot: bool = False,
+              plot_workers: Optional[int] = None, engine: Optional[str] = None,
+              exclude: Iterable[str] = (), cache_directory: Optional[str] = None,
+              cache_max_bytes: int = DEFAULT_MAX_BYTES, plot_format: str = 'png',
+              simulation_mode: Optional[str] = None) -> List[CaseResult]:
+    """
+    Fans the cases out over a process pool. Plots, when requested, are rendered by a separate pool as soon as each
+    case is solved, so rendering never holds back the solvers.
+
+    Args:
+        directory: folder with the case JSON files
+        workers: solver processes, defaults to the CPU count
+        plot: renders test_cases/images/interface_<case>.<plot_format> for each solved case
+        plot_workers: plotting processes, defaults to ``workers``
+        engine: optimizer backend, defaults to the one of each input file
+        exclude: case names to skip
+        cache_directory: result cache shared by the workers, none by default
+        cache_max_bytes: size bound of the result cache
+        plot_format: image format of the plots (png, svg, pdf) or html
+        simulation_mode: overrides the one of each input file
+
+    Returns:
+        one result per case, in file name order
+    """
+    cases = list_cases(directory, exclude)
+    results: Dict[str, CaseResult] = {}
+    plots: Dict[Future, str] = {}
+    plot_pool = ProcessPoolExecutor(max_workers=plot_workers or workers) if plot else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as solve_pool:
+            futures = [solve_pool.submit(solve_case, file_path, engine, plot, cache_directory, cache_max_bytes,
+                                         simulation_mode) for file_path in cases]
+            for future in as_completed(futures):
+                result = future.result()
+                if plot_pool is not None and result.error is None:
+                    plots[plot_pool.submit(plot_case, result.ct_name, result.pig_iron_balance,
+                                                     plot_format)] = result.ct_name
+                result.pig_iron_balance = None
+                results[result.ct_name] = result
+        for future in as_completed(plots):
+            # a failing plot (e.g. no image export backend) keeps the solved result
+            try:
+                results[plots[future]].plot_time = future.result()
+            except Exception as error:
+                results[plots[future]].plot_error = repr(error)
+    finally:
+        if plot_pool is not None:
+            plot_pool.shutdown()
+    return sorted(results.values(), key=lambda result: result.ct_name)
+
+
+def print_results(results: List[CaseResult]):
+    print(f'{"case":<8}{"engine":<8}{"initial":>8}{"final":>8}{"final state":>14}{"iterations":>12}'
+          f'{"time [s]":>10}')
+    for result in results:
+        if result.error:
+            print(f'{result.ct_name:<8}failed: {result.error}')
+            continue
+        print(f'{result.ct_name:<8}{result.engine:<8}{result.initial_spill_events:>8}{result.final_spill_events:>8}'
+              f'{result.final_state:>14.4f}{len(result.liquid_profit_dict):>12}{result.wall_time:>10.3f}'
+              f'{" (cached)" if result.cached else ""}'
+              f'{f" - plot failed: {result.plot_error}" if result.plot_error else ""}')
+
+
+if __name__ == '__main__':
+    # the options of ``python main.py batch``, except that plots stay opt-in here
+    from main import main
+
+    arguments = sys.argv[1:]
+    if '--plot' in arguments:
+        arguments.remove('--plot')
+    else:
+        arguments.append('--no-plot')
+    sys.exit(main(['batch'] + arguments))
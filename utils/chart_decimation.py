@@ -0,0 +1,32 @@
+from typing import Optional
+
+import numpy as np
+
+
+def min_max_indices(x: np.ndarray, y: np.ndarray, buckets: int, keep: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Min/max decimation: splits the x range in ``buckets`` equal buckets (about one per pixel) and keeps the first,
+    last, lowest and highest point of each, so every peak and every spill drop survives. O(n log n), no Python loop.
+
+    Args:
+        x: sorted abscissas (e.g. microseconds)
+        y: values
+        buckets: number of buckets, at most 4 points are kept per bucket
+        keep: indices kept whatever their bucket
+
+    Returns:
+        sorted indices of the points to draw
+    """
+    n = len(x)
+    if n <= 4 * buckets:
+        return np.arange(n)
+    edges = np.linspace(x[0], x[-1], buckets + 1)
+    bucket = np.clip(np.searchsorted(edges, x, side='right') - 1, 0, buckets - 1)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    # sorted by bucket then value: each bucket keeps its range of positions, its lowest point first
+    order = np.lexsort((y, bucket))
+    indices = [starts, ends, order[starts], order[ends]]
+    if keep is not None:
+        indices.append(np.asarray(keep, dtype=np.int64))
+    return np.unique(np.concatenate(indices))
@@ -0,0 +1,146 @@
+"""
+Columnar ingestion of schedule files: the converter arrays are parsed straight into NumPy columns, timestamps in a
+single vectorized ``datetime64`` conversion, instead of handing every ISO string to the pydantic validator.
+"""
+import json
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import numpy as np
+
+from model.pig_iron_balance import Converter, Maintenance, PigIronBalance, PigIronBalanceState
+
+TIME_UNIT = 'datetime64[us]'
+
+
+def parse_timestamps(values) -> np.ndarray:
+    """
+    Args:
+        values: ISO 8601 strings ('T' or ' ' separated), without timezone
+
+    Returns:
+        ``datetime64[us]`` array
+    """
+    return np.array(values, dtype=TIME_UNIT)
+
+
+@dataclass
+class ConverterColumns:
+    """
+    Converter schedule as parallel arrays, sorted by time (stable, ``converter_1`` first on ties, like
+    ``PigIronBalance`` sorts its converters).
+    """
+    times: np.ndarray
+    hmr: np.ndarray
+    cv: np.ndarray
+
+    def __len__(self):
+        return len(self.times)
+
+    @classmethod
+    def from_records(cls, *converter_lists) -> 'ConverterColumns':
+        records = [converter for converters in converter_lists for converter in converters]
+        times = parse_timestamps([converter['time'] for converter in records])
+        hmr = np.fromiter((converter['hmr'] for converter in records), dtype=np.float64, count=len(records))
+        cv = np.array([converter['cv'] for converter in records], dtype=object)
+        order = np.argsort(times, kind='stable')
+        return cls(times=times[order], hmr=hmr[order], cv=cv[order])
+
+    @property
+    def microseconds(self) -> np.ndarray:
+        """
+        Returns:
+            times in microseconds since epoch, the time base of ``BalanceTrace``
+        """
+        return self.times.astype(np.int64)
+
+    def to_converters(self):
+        """
+        Returns:
+            ``Converter`` objects built with ``construct``, the columns are already typed
+        """
+        construct = Converter.construct
+        return [construct(time=time, hmr=hmr, cv=cv, index=index)
+                for index, (time, hmr, cv) in enumerate(zip(self.times.tolist(), self.hmr.tolist(),
+                                                            self.cv.tolist()))]
+
+
+@dataclass
+class ColumnarInput:
+    converters: ConverterColumns
+    initial_time: np.datetime64
+    initial_value: float
+    pig_iron_hourly_production: float
+    max_restrictive: float
+    allow_auto_spill_events: bool
+    maintenances: Dict[str, Dict[str, np.ndarray]] = field(default_factory=dict)
+    optimize_hmr: bool = False
+    simulation_mode: str = 'python'
+    optimizer_engine: str = 'greedy'
+
+
+def columnar_input(input_data: dict) -> ColumnarInput:
+    """
+    Args:
+        input_data: JSON-like dict, as read from a test case file
+
+    Returns:
+
+    """
+    maintenances = {}
+    for cv, key in (('CV 1', 'maintenances_cv1'), ('CV 2', 'maintenances_cv2')):
+        records = input_data.get(key, [])
+        maintenances[cv] = {
+            'times': parse_timestamps([maintenance['time'] for maintenance in records]),
+            'durations': np.array([maintenance['duration'] for maintenance in records], dtype=np.float64),
+        }
+    return ColumnarInput(
+        converters=ConverterColumns.from_records(input_data['converter_1'], input_data['converter_2']),
+        initial_time=np.datetime64(input_data['initial_conditions']['time'], 'us'),
+        initial_value=float(input_data['initial_conditions']['value']),
+        pig_iron_hourly_production=input_data['pig_iron_hourly_production'],
+        max_restrictive=input_data['max_restrictive'],
+        allow_auto_spill_events=input_data['allow_auto_spill_events'],
+        maintenances=maintenances,
+        optimize_hmr=input_data.get('optimize_hmr', False),
+        simulation_mode=input_data.get('simulation_mode', 'python'),
+        optimizer_engine=input_data.get('optimizer_engine', 'greedy'),
+    )
+
+
+def load_columnar(file_path: str) -> ColumnarInput:
+    with open(file_path) as json_file:
+        return columnar_input(json.load(json_file))
+
+
+def pig_iron_balance_from_columns(columns: ColumnarInput, simulation_mode: Optional[str] = None,
+                                  optimizer_engine: Optional[str] = None) -> PigIronBalance:
+    """
+    Columnar counterpart of ``pig_iron_balance_model``: no field goes through pydantic validation.
+
+    Args:
+        columns: see ``columnar_input``
+        simulation_mode: overrides the one of the input
+        optimizer_engine: overrides the one of the input
+
+    Returns:
+
+    """
+    maintenances = {
+        cv: [Maintenance.construct(time=time, duration=duration)
+             for time, duration in zip(columns_cv['times'].tolist(), columns_cv['durations'].tolist())]
+        for cv, columns_cv in columns.maintenances.items()
+    }
+    return PigIronBalance(
+        initial_conditions=PigIronBalanceState.construct(time=columns.initial_time.tolist(),
+                                                         value=columns.initial_value),
+        converters=columns.converters.to_converters(),
+        spill_events=[],
+        pig_iron_hourly_production=columns.pig_iron_hourly_production,
+        max_restrictive=columns.max_restrictive,
+        allow_auto_spill_events=columns.allow_auto_spill_events,
+        maintenances=maintenances,
+        optimize=columns.optimize_hmr,
+        simulation_mode=simulation_mode or columns.simulation_mode,
+        optimizer_engine=optimizer_engine or columns.optimizer_engine,
+    )
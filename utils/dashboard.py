@@ -0,0 +1,315 @@
+"""
+Self-contained HTML dashboard of solved cases.
+
+Every case is embedded once as columnar arrays (little-endian typed arrays, base64 encoded); the Gantt, the balance
+and the per-iteration profit charts are built in the browser from them, so both the file size and the generation
+time are linear in the number of events.
+
+Run from the repository root, with case files (solved here) or snapshots:
+    python -m utils.dashboard test_cases/ct7.1.json runs/ct8.1.pibsnap [-o dashboard.html] [--engine lp]
+"""
+import argparse
+import base64
+import json
+import os
+import string
+from typing import Dict, Optional
+
+import numpy as np
+
+from model.balance_trace import BalanceStateKind
+
+MICROSECONDS_PER_MS = 1000
+
+
+def _encode(array: np.ndarray, dtype: str) -> str:
+    return base64.b64encode(np.ascontiguousarray(array, dtype=dtype).tobytes()).decode('ascii')
+
+
+def _milliseconds(times: list) -> np.ndarray:
+    return np.array(times, dtype='datetime64[us]').astype(np.int64) / MICROSECONDS_PER_MS
+
+
+def case_payload(pig_iron_balance) -> dict:
+    """
+    Args:
+        pig_iron_balance: simulated (usually optimized) balance
+
+    Returns:
+        JSON-ready columns of the case; times are milliseconds since epoch relative to ``t0``, as plotly reads
+        dates, and values are in p.u.
+    """
+    trace = pig_iron_balance.balance_trace
+    t0 = int(trace.times[0]) // MICROSECONDS_PER_MS if len(trace) else 0
+    converters = pig_iron_balance.converters
+    maintenances = pig_iron_balance.maintenance_index.windows()
+    report = pig_iron_balance.optimizer_report
+    profit = pig_iron_balance.liquid_profit_dict
+    return {
+        't0': t0,
+        'balance': {
+            'time': _encode(trace.times / MICROSECONDS_PER_MS - t0, '<f8'),
+            'value': _encode(trace.values, '<f4'),
+            'kind': _encode(trace.kinds, '<i1'),
+        },
+        'converters': {
+            'start': _encode(_milliseconds([converter.time for converter in converters]) - t0, '<f8'),
+            'hmr': _encode([converter.hmr for converter in converters], '<f4'),
+            'cv': _encode([int(converter.cv == 'cv_2') for converter in converters], '<u1'),
+        },
+        'maintenances': {
+            'start': _encode(_milliseconds([start for _, start, _ in maintenances]) - t0, '<f8'),
+            'end': _encode(_milliseconds([end for _, _, end in maintenances]) - t0, '<f8'),
+            'cv': _encode([int(cv == 'cv_2') for cv, _, _ in maintenances], '<u1'),
+        },
+        'profit': {
+            'iteration': _encode(list(profit.keys()), '<i4'),
+            'value': _encode(list(profit.values()), '<f8'),
+        },
+        'parameters': {
+            'max_restrictive': pig_iron_balance.max_restrictive,
+            'torpedo_car_volume': pig_iron_balance.pig_iron_constants.torpedo_car_volume,
+            'k': pig_iron_balance.k,
+            'production': pig_iron_balance.pig_iron_hourly_production,
+            'initial_value': pig_iron_balance.initial_conditions.value,
+            'min_hmr': pig_iron_balance.min_hmr,
+            'max_hmr': pig_iron_balance.max_hmr,
+        },
+        'summary': {
+            'converters': len(converters),
+            'initial_spill_events': pig_iron_balance.initial_spill_count,
+            'spill_events': len(pig_iron_balance.spill_events),
+            'final_state': pig_iron_balance.last_state.value if len(trace) else None,
+            'engine': report.engine if report else None,
+            'status': report.status if report else None,
+            'iterations': len(profit),
+        },
+    }
+
+
+def generate_dashboard(cases: Dict[str, object], title: str = 'Saldo de Gusa', include_plotlyjs='inline') -> str:
+    """
+    Args:
+        cases: {case name: simulated PigIronBalance}
+        title: page title
+        include_plotlyjs: 'inline' embeds plotly.js (works offline), 'cdn' links it
+
+    Returns:
+        the HTML page
+    """
+    if include_plotlyjs == 'inline':
+        from plotly.offline import get_plotlyjs
+        plotly_script = f'<script type="text/javascript">{get_plotlyjs()}</script>'
+    else:
+        plotly_script = '<script src="https://cdn.plot.ly/plotly-2.35.2.min.js"></script>'
+    data = json.dumps({name: case_payload(pig_iron_balance) for name, pig_iron_balance in cases.items()},
+                      separators=(',', ':'))
+    # '</' cannot appear inside the script element
+    data = data.replace('</', '<\\/')
+    return DASHBOARD_TEMPLATE.substitute(title=title, plotly_script=plotly_script, data=data,
+                                         spill_kind=int(BalanceStateKind.SPILL))
+
+
+def write_dashboard(cases: Dict[str, object], path: str, title: str = 'Saldo de Gusa',
+                    include_plotlyjs='inline') -> str:
+    """
+    Args:
+        cases: {case name: simulated PigIronBalance}
+        path: HTML file
+        title: page title
+        include_plotlyjs: see ``generate_dashboard``
+
+    Returns:
+        the path
+    """
+    html = generate_dashboard(cases, title, include_plotlyjs)
+    with open(path, 'w', encoding='utf-8') as html_file:
+        html_file.write(html)
+    return path
+
+
+def load_case(file_path: str, engine: Optional[str] = None):
+    """
+    Returns:
+        the balance of a snapshot as saved, or the optimized balance of a case file
+    """
+    from model.pig_iron_balance import PigIronBalance
+    from utils.columnar_loader import load_columnar, pig_iron_balance_from_columns
+
+    if file_path.endswith('.pibsnap'):
+        return PigIronBalance.load_snapshot(file_path)
+    pig_iron_balance = pig_iron_balance_from_columns(load_columnar(file_path))
+    pig_iron_balance.optimize_hmr(engine=engine)
+    return pig_iron_balance
+
+
+DASHBOARD_TEMPLATE = string.Template('''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+$plotly_script
+<style>
+body { font-family: sans-serif; margin: 16px; }
+#summary td, #summary th { padding: 2px 10px; text-align: right; }
+#summary tr.selected { background: #dde6f5; }
+#summary tr { cursor: pointer; }
+</style>
+</head>
+<body>
+<h2>$title</h2>
+<label>Case <select id="case"></select></label>
+<table id="summary"></table>
+<div id="gantt" style="height: 220px"></div>
+<div id="balance" style="height: 420px"></div>
+<div id="profit" style="height: 300px"></div>
+<script type="application/json" id="data">$data</script>
+<script type="text/javascript">
+const SPILL = $spill_kind;
+const CASES = JSON.parse(document.getElementById('data').textContent);
+const TYPES = {f8: Float64Array, f4: Float32Array, i4: Int32Array, i1: Int8Array, u1: Uint8Array};
+const LABELS = ['CV 1', 'CV 2'];
+
+function decode(text, type) {
+    const bytes = Uint8Array.from(atob(text), c => c.charCodeAt(0));
+    return new TYPES[type](bytes.buffer);
+}
+
+function columns(item) {
+    return {
+        balance: {time: decode(item.balance.time, 'f8'), value: decode(item.balance.value, 'f4'),
+                  kind: decode(item.balance.kind, 'i1')},
+        converters: {start: decode(item.converters.start, 'f8'), hmr: decode(item.converters.hmr, 'f4'),
+                     cv: decode(item.converters.cv, 'u1')},
+        maintenances: {start: decode(item.maintenances.start, 'f8'), end: decode(item.maintenances.end, 'f8'),
+                       cv: decode(item.maintenances.cv, 'u1')},
+        profit: {iteration: decode(item.profit.iteration, 'i4'), value: decode(item.profit.value, 'f8')},
+    };
+}
+
+function ganttChart(item, data, range) {
+    const t0 = item.t0, c = data.converters, m = data.maintenances, n = c.start.length;
+    const base = new Array(n), y = new Array(n), text = new Array(n);
+    for (let i = 0; i < n; i++) {
+        base[i] = t0 + c.start[i];
+        y[i] = LABELS[c.cv[i]];
+        text[i] = 't' + (i + 1) + ': ' + Math.round((c.start[i] - data.balance.time[0]) / 60000) + 'min ρ' +
+            (i + 1) + ': ' + c.hmr[i].toFixed(2);
+    }
+    const bars = {type: 'bar', orientation: 'h', base: base, x: new Array(n).fill(3600000), y: y,
+                  hovertext: text, hoverinfo: 'text',
+                  marker: {color: Array.from(c.hmr), colorscale: 'Bluered', cmin: item.parameters.min_hmr,
+                           cmax: item.parameters.max_hmr, showscale: true,
+                           colorbar: {orientation: 'h', thickness: 15, y: 1.15, x: 0.76, len: 0.5}}};
+    const mx = [], my = [];
+    for (let i = 0; i < m.start.length; i++) {
+        mx.push(t0 + m.start[i], t0 + m.end[i], null);
+        my.push(LABELS[m.cv[i]], LABELS[m.cv[i]], null);
+    }
+    const maintenance = {type: 'scatter', mode: 'lines', x: mx, y: my, name: 'Manutenção',
+                         line: {color: 'gray', width: 25}, hoverinfo: 'x'};
+    Plotly.react('gantt', [bars, maintenance], {
+        title: 'Gantt', showlegend: false, barmode: 'overlay', margin: {l: 60, r: 30, t: 40, b: 30},
+        xaxis: {type: 'date', range: range}, yaxis: {title: 'Equipamento', categoryarray: LABELS}
+    });
+}
+
+function balanceChart(item, data, range) {
+    const t0 = item.t0, b = data.balance, n = b.time.length;
+    const x = new Array(n), sx = [], sy = [], bars = [];
+    for (let i = 0; i < n; i++) {
+        x[i] = t0 + b.time[i];
+        if (b.kind[i] === SPILL && i + 1 < n) {
+            sx.push(t0 + b.time[i], t0 + b.time[i + 1], null);
+            sy.push(b.value[i], b.value[i + 1], null);
+            bars.push(t0 + b.time[i]);
+        }
+    }
+    const p = item.parameters;
+    const traces = [
+        {type: 'scattergl', mode: 'lines', x: x, y: b.value, name: 'Saldo de Gusa [pu]',
+         line: {color: 'darkblue', width: 2}, hovertemplate: 'Hour: %{x}<br>Value: %{y:.2f}<extra></extra>'},
+        {type: 'scattergl', mode: 'lines', x: sx, y: sy, name: 'Basculamento', line: {color: 'red', width: 5},
+         hoverinfo: 'none'},
+        {type: 'bar', x: bars, y: new Array(bars.length).fill(p.torpedo_car_volume), width: 900000,
+         marker: {color: 'red'}, name: 'Basculamento', hovertemplate: 'Hour: %{x}<extra></extra>'},
+    ];
+    const legend = ['η=' + p.torpedo_car_volume + ' pu', 'k=' + p.k + ' pu', 'v̅=' + p.max_restrictive + ' pu',
+                    'v<sub>0</sub>=' + p.initial_value.toFixed(2) + ' pu', 'Φ=' + p.production + ' pu/h'];
+    Plotly.react('balance', traces, {
+        title: 'Saldo de Gusa [pu]', showlegend: false, margin: {l: 60, r: 30, t: 40, b: 40},
+        xaxis: {type: 'date', title: 'Tempo', range: range},
+        yaxis: {title: 'Ferro-Gusa [pu]', range: [0, p.max_restrictive + p.torpedo_car_volume]},
+        shapes: [{type: 'line', xref: 'paper', x0: 0, x1: 1, y0: p.max_restrictive, y1: p.max_restrictive,
+                  line: {color: 'red', width: 2}}],
+        annotations: legend.map((text, i) => ({xref: 'paper', yref: 'paper', x: 0, y: 0.2 - 0.05 * i, text: text,
+                                               showarrow: false, xanchor: 'left', yanchor: 'bottom'})),
+    });
+}
+
+function profitChart(data) {
+    Plotly.react('profit', [{type: 'bar', x: Array.from(data.profit.iteration), y: Array.from(data.profit.value)}], {
+        title: 'Lucro Líquido por Iteração', xaxis: {title: 'Iterações'}, yaxis: {title: 'Lucro Líquido (R$$)'},
+        margin: {l: 60, r: 30, t: 40, b: 40},
+    });
+}
+
+function summaryTable(selected) {
+    const fields = ['converters', 'initial_spill_events', 'spill_events', 'final_state', 'engine', 'iterations'];
+    let html = '<tr><th>case</th>' + fields.map(f => '<th>' + f.replace(/_/g, ' ') + '</th>').join('') + '</tr>';
+    for (const [name, item] of Object.entries(CASES)) {
+        const cells = fields.map(f => {
+            const value = item.summary[f];
+            return '<td>' + (typeof value === 'number' && !Number.isInteger(value) ? value.toFixed(4) : value) +
+                '</td>';
+        });
+        html += '<tr data-case="' + name + '"' + (name === selected ? ' class="selected"' : '') + '><td>' + name +
+            '</td>' + cells.join('') + '</tr>';
+    }
+    const table = document.getElementById('summary');
+    table.innerHTML = html;
+    table.querySelectorAll('tr[data-case]').forEach(row => row.onclick = () => show(row.dataset.case));
+}
+
+const decoded = {};
+function show(name) {
+    const item = CASES[name];
+    const data = decoded[name] = decoded[name] || columns(item);
+    const time = data.balance.time;
+    const range = time.length ? [item.t0 + time[0], item.t0 + time[time.length - 1]] : undefined;
+    document.getElementById('case').value = name;
+    summaryTable(name);
+    ganttChart(item, data, range);
+    balanceChart(item, data, range);
+    profitChart(data);
+}
+
+const select = document.getElementById('case');
+for (const name of Object.keys(CASES)) {
+    select.add(new Option(name, name));
+}
+select.onchange = () => show(select.value);
+show(Object.keys(CASES)[0]);
+// zooming the balance zooms the Gantt
+document.getElementById('balance').on('plotly_relayout', event => {
+    const range = event['xaxis.range[0]'] !== undefined ? [event['xaxis.range[0]'], event['xaxis.range[1]']] :
+        (event['xaxis.autorange'] ? null : undefined);
+    if (range !== undefined) Plotly.relayout('gantt', range ? {'xaxis.range': range} : {'xaxis.autorange': true});
+});
+</script>
+</body>
+</html>
+''')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='+', help='case JSON files or .pibsnap snapshots')
+    parser.add_argument('-o', '--output', default='dashboard.html')
+    parser.add_argument('--engine', choices=['greedy', 'lp', 'milp'], default=None)
+    parser.add_argument('--cdn', action='store_true', help='links plotly.js instead of embedding it')
+    args = parser.parse_args()
+
+    cases = {os.path.basename(file_path).rsplit('.', 1)[0]: load_case(file_path, args.engine)
+             for file_path in args.files}
+    print(write_dashboard(cases, args.output, include_plotlyjs='cdn' if args.cdn else 'inline'))
@@ -1,16 +1,39 @@
+from datetime import datetime
+
 from model.pig_iron_balance import PigIronBalanceState, Converter, PigIronBalance, Maintenance
 
 
-def pig_iron_balance_model(input_data):
+def _trusted_time(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _build(model, data, trusted):
+    if not trusted:
+        return model(**data)
+    return model.construct(**{**data, 'time': _trusted_time(data.get('time'))})
+
+
+def pig_iron_balance_model(input_data, trusted=False):
+    """
+    Builds a PigIronBalance from a JSON-like dict.
+
+    Args:
+        input_data:
+        trusted: skips pydantic validation for input produced by our own tooling (ISO timestamps, right types)
+
+    Returns:
+
+    """
 
-    initial_conditions = PigIronBalanceState(**input_data["initial_conditions"])
-    converters = [Converter(**converter) for converter in input_data["converter_1"] + input_data["converter_2"]]
+    initial_conditions = _build(PigIronBalanceState, input_data["initial_conditions"], trusted)
+    converters = [_build(Converter, converter, trusted)
+                  for converter in input_data["converter_1"] + input_data["converter_2"]]
     pig_iron_hourly_production = input_data["pig_iron_hourly_production"]
     max_restrictive = input_data["max_restrictive"]
     allow_auto_spill_events = input_data["allow_auto_spill_events"]
     maintenances = {
-        'CV 1': [Maintenance(**mnt) for mnt in input_data.get("maintenances_cv1", [])],
-        'CV 2': [Maintenance(**mnt) for mnt in input_data.get("maintenances_cv2", [])]
+        'CV 1': [_build(Maintenance, mnt, trusted) for mnt in input_data.get("maintenances_cv1", [])],
+        'CV 2': [_build(Maintenance, mnt, trusted) for mnt in input_data.get("maintenances_cv2", [])]
     }
 
     return PigIronBalance(initial_conditions=initial_conditions,
@@ -20,4 +43,6 @@ def pig_iron_balance_model(input_data):
                           max_restrictive=max_restrictive,
                           allow_auto_spill_events=allow_auto_spill_events,
                           maintenances=maintenances,
-                          optimize=input_data.get("optimize_hmr", False))
+                          optimize=input_data.get("optimize_hmr", False),
+                          simulation_mode=input_data.get("simulation_mode", "python"),
+                          optimizer_engine=input_data.get("optimizer_engine", "greedy"))
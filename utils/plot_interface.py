@@ -1,75 +1,241 @@
-import locale
+"""
+Plotting of solved balances. Only plotly.graph_objects/io are loaded with the module; pandas, plotly.express and
+plotly.subplots are imported on first use.
+"""
+import atexit
 import os
-import plotly.colors as pc
-from sympy.parsing.latex import parse_latex
-
-from model.pig_iron_balance import Converter
-from sympy import symbols, Eq, parse_expr
-from sympy.printing import latex
-import unicodedata
-
-import colorlover as cl
-
-colorscale = cl.scales['9']['seq']['Blues']
-
 from datetime import datetime, timedelta
-import pandas as pd
-import plotly.express as px
-
-from model.pig_iron_balance import PigIronBalance
 
-from PIL import Image
-import plotly.io as pio
+import numpy as np
 import plotly.graph_objects as go
+import plotly.io as pio
 
-
-def plot_interface(ct_name, pig_iron_balance, debug=True):
-    gantt = generate_gantt_chart(pig_iron_balance.initial_conditions.time, pig_iron_balance.converters, pig_iron_balance.maintenances)
-    balance = generate_pig_iron_balance_chart(pig_iron_balance, [spill.time for spill in pig_iron_balance.spill_events])
-    #profit = plot_profit_per_iteration(pig_iron_balance.liquid_profit_dict)
-    pio.write_image(gantt, f"test_cases/images/gantt_{ct_name}.png", format='png', width=800, height=200, scale=3)
-    pio.write_image(balance, f"test_cases/images/balance_{ct_name}.png", format='png', width=800, height=400, scale=3)
-    #
-    save_plot(ct_name, debug)
+from model.balance_trace import BalanceStateKind
+from model.pig_iron_balance import Converter, PigIronBalance
+from utils.chart_decimation import min_max_indices
+
+
+# Size of the exported interface; the scale reproduces the 4000 px wide PNGs of the former PIL pipeline
+INTERFACE_WIDTH = 800
+GANTT_HEIGHT = 200
+BALANCE_HEIGHT = 400
+IMAGE_SCALE = 5
+DECIMATION_BUCKETS = INTERFACE_WIDTH
+# Level of detail: label texts appear once at most this many labelled points are in view
+MAX_LABELS = 120
+# Scalable mode (bounded trace and annotation counts) is used once the classic figure would draw more labelled
+# events (converters, spills, maintenances; about one annotation or trace each) than this
+SCALABLE_EVENTS = MAX_LABELS
+
+# Shows the texts of the 'lod-labels' traces only when few of their points are in the visible x range
+LOD_SCRIPT = '''
+const gd = document.getElementById('{plot_id}');
+const time = value => new Date(String(value).replace(' ', 'T')).getTime();
+function levelOfDetail() {
+    const modes = [], indices = [];
+    gd.data.forEach((trace, index) => {
+        if (trace.meta !== 'lod-labels') return;
+        const axis = gd._fullLayout['xaxis' + (trace.xaxis || 'x').slice(1)];
+        const [low, high] = axis.range.map(time);
+        const visible = trace.x.filter(x => { const t = time(x); return t >= low && t <= high; }).length;
+        const mode = visible <= %d ? 'markers+text' : 'markers';
+        if (trace.mode !== mode) { modes.push(mode); indices.push(index); }
+    });
+    if (indices.length) Plotly.restyle(gd, {mode: modes}, indices);
+}
+gd.on('plotly_relayout', levelOfDetail);
+levelOfDetail();
+''' % MAX_LABELS
+
+
+class ImageRenderer:
+    """
+    Static image export through a kaleido process kept alive across figures, instead of one browser start per
+    export. Works as a context manager; ``get_renderer`` holds the one shared by a whole run.
+    """
+
+    def __init__(self):
+        self.started = False
+
+    def start(self):
+        import kaleido
+        # kaleido >= 1 keeps its browser alive between calls once the sync server runs; older versions keep their
+        # subprocess alive by themselves
+        if not self.started and hasattr(kaleido, 'start_sync_server'):
+            kaleido.start_sync_server()
+            self.started = True
+        return self
+
+    def stop(self):
+        if self.started:
+            import kaleido
+            kaleido.stop_sync_server()
+            self.started = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def to_bytes(self, fig, format='png', width=None, height=None, scale=IMAGE_SCALE) -> bytes:
+        return pio.to_image(fig, format=format, width=width, height=height, scale=scale)
+
+    def write(self, fig, path, format=None, width=None, height=None, scale=IMAGE_SCALE):
+        with open(path, 'wb') as image_file:
+            image_file.write(self.to_bytes(fig, format or os.path.splitext(path)[1].lstrip('.') or 'png',
+                                           width, height, scale))
+
+
+_renderer = None
+
+
+def get_renderer() -> ImageRenderer:
+    global _renderer
+    if _renderer is None:
+        _renderer = ImageRenderer().start()
+        atexit.register(_renderer.stop)
+    return _renderer
+
+
+def is_scalable(pig_iron_balance, scalable=None) -> bool:
+    """
+    Returns:
+        ``scalable`` when given, otherwise whether the balance has too many events for the classic figure
+    """
+    if scalable is not None:
+        return scalable
+    # maintenances are keyed by converter ('CV 1', 'CV 2'), each with its windows
+    maintenances = sum(len(windows) for windows in pig_iron_balance.maintenances.values())
+    events = len(pig_iron_balance.converters) + len(pig_iron_balance.spill_events) + maintenances
+    return events > SCALABLE_EVENTS
+
+
+def lod_labels_trace(x, y, text, marker=None, textposition='middle center'):
+    """
+    Labels as a single trace; starts without texts when it has more than ``MAX_LABELS`` points, ``LOD_SCRIPT``
+    shows them once zoomed in. Texts stay available on hover.
+    """
+    return go.Scatter(
+        x=x,
+        y=y,
+        mode='markers+text' if len(text) <= MAX_LABELS else 'markers',
+        text=text,
+        hovertext=text,
+        textposition=textposition,
+        marker=marker or dict(size=1, opacity=0),
+        meta='lod-labels',
+        showlegend=False,
+    )
 
 
-def save_plot(ct_name, debug):
-    # Load the PNG files
-    image2 = Image.open(f"test_cases/images/balance_{ct_name}.png")
-    image1 = Image.open(f"test_cases/images/gantt_{ct_name}.png")
+def write_html(fig, path):
+    fig.write_html(path, include_plotlyjs='cdn', post_script=LOD_SCRIPT)
 
-    # Get the dimensions of the images
-    width = max(image1.width, image2.width)
-    height = image1.height + image2.height
 
-    # Create a new blank image with the combined dimensions
-    combined_image = Image.new("RGBA", (width, height))
+def plot_interface(ct_name, pig_iron_balance, debug=True, output='file', renderer=None, format='png',
+                   scalable=None):
+    """
+    Renders the Gantt over the balance as one figure, exported once.
 
-    # Paste the first image at the top
-    combined_image.paste(image1, (0, 0))
+    Args:
+        ct_name: case name, the file is test_cases/images/interface_<ct_name>.<format>
+        pig_iron_balance: simulated balance
+        debug: also opens the figure
+        output: 'file' writes the image, 'bytes' returns it, 'figure' returns the figure without exporting it
+        renderer: defaults to the process-wide one
+        format: image format, or 'html' for an interactive page with level-of-detail labels
+        scalable: forces the scalable mode on or off, see ``is_scalable``
 
-    # Paste the second image below the first image
-    combined_image.paste(image2, (0, image1.height))
+    Returns:
+        the path, the image bytes or the figure, depending on ``output``
+    """
+    fig = generate_interface_figure(pig_iron_balance, scalable)
     if debug:
-        combined_image.show()
-
-    # Set the desired DPI value
-    dpi = 120
+        fig.show()
+    if output == 'figure':
+        return fig
+    if format == 'html':
+        if output == 'bytes':
+            return fig.to_html(include_plotlyjs='cdn', post_script=LOD_SCRIPT).encode()
+        path = f"test_cases/images/interface_{ct_name}.html"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_html(fig, path)
+        return path
+
+    renderer = renderer or get_renderer()
+    if output == 'bytes':
+        return renderer.to_bytes(fig, format)
+    path = f"test_cases/images/interface_{ct_name}.{format}"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    renderer.write(fig, path, format)
+    return path
+
+
+def generate_interface_figure(pig_iron_balance, scalable=None):
+    """
+    Gantt (top) and pig iron balance (bottom) on two subplots sharing the time axis.
+
+    Args:
+        pig_iron_balance: simulated balance
+        scalable: see ``is_scalable``
+
+    Returns:
+
+    """
+    scalable = is_scalable(pig_iron_balance, scalable)
+    gantt = generate_gantt_chart(pig_iron_balance.initial_conditions.time, pig_iron_balance.converters,
+                                 pig_iron_balance.maintenances, scalable)
+    balance = generate_pig_iron_balance_chart(pig_iron_balance,
+                                              [spill.time for spill in pig_iron_balance.spill_events], scalable)
+
+    from plotly.subplots import make_subplots
+
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.08,
+                        row_heights=[GANTT_HEIGHT, BALANCE_HEIGHT],
+                        subplot_titles=[gantt.layout.title.text, balance.layout.title.text])
+    for trace in gantt.data:
+        fig.add_trace(trace, row=1, col=1)
+    for trace in balance.data:
+        fig.add_trace(trace, row=2, col=1)
+    for shape in balance.layout.shapes:
+        fig.add_shape(shape, row=2, col=1)
+    for annotation in gantt.layout.annotations:
+        fig.add_annotation(annotation, row=1, col=1)
+    for annotation in balance.layout.annotations:
+        if annotation.xref == 'paper':
+            # the parameter legend sits at the bottom left of the balance subplot
+            annotation = go.layout.Annotation(annotation, xref='x2 domain', yref='y2 domain')
+            fig.add_annotation(annotation)
+        else:
+            fig.add_annotation(annotation, row=2, col=1)
 
-    # Calculate the size of the saved image based on DPI
-    width_in_pixels = int(combined_image.width * dpi / 72)
-    height_in_pixels = int(combined_image.height * dpi / 72)
-
-    # Create a new image with the desired DPI and size
-    new_image = combined_image.resize((width_in_pixels, height_in_pixels))
+    fig.update_layout(
+        coloraxis=gantt.layout.coloraxis,
+        showlegend=False,
+        barmode=gantt.layout.barmode,
+        height=GANTT_HEIGHT + BALANCE_HEIGHT,
+        width=INTERFACE_WIDTH,
+        margin=dict(l=50, r=50, t=50, b=50),
+    )
+    fig.update_coloraxes(colorbar={'orientation': 'h', 'thickness': 20, 'y': 1.02, 'x': 0.76, 'len': 0.51,
+                                   'nticks': 20})
+    for row, source in ((1, gantt), (2, balance)):
+        yaxis = source.layout.yaxis.to_plotly_json()
+        # the subplot grid owns the placement of the axes
+        yaxis.pop('domain', None)
+        yaxis.pop('anchor', None)
+        fig.update_yaxes(yaxis, row=row, col=1)
+    fig.update_xaxes(showgrid=True, gridcolor='white', gridwidth=1, range=balance.layout.xaxis.range)
+    fig.update_xaxes(title_text=balance.layout.xaxis.title.text, row=2, col=1)
+    return fig
 
-    # Save the new image with high resolution
-    new_image.save(f"test_cases/images/interface_{ct_name}.png", dpi=(dpi, dpi))
-    os.remove(f"test_cases/images/balance_{ct_name}.png")
-    os.remove(f"test_cases/images/gantt_{ct_name}.png")
 
+def generate_gantt_chart(initial_time, converters: list[Converter], maintenances, scalable=False):
+    import pandas as pd
+    import plotly.colors as pc
+    import plotly.express as px
 
-def generate_gantt_chart(initial_time, converters: list[Converter], maintenances):
     # Gantt Chart Data
     data_gantt = []
     converter_labels = ["CV 1", "CV 2"]
@@ -93,6 +259,21 @@ def generate_gantt_chart(initial_time, converters: list[Converter], maintenances
                             )
 
     for cv_name, maintenances_list in maintenances.items():
+        if scalable and maintenances_list:
+            # one trace per converter, windows separated by gaps
+            fig_gantt.add_trace(
+                go.Scatter(
+                    name='Manutenção',
+                    x=[time for maintenance in maintenances_list
+                       for time in (maintenance.time, maintenance.time + timedelta(hours=maintenance.duration), None)],
+                    y=[cv_name if index % 3 != 2 else None for index in range(3 * len(maintenances_list))],
+                    mode='lines',
+                    line=dict(color='gray', width=25),
+                    hovertemplate='<b>Maintenance</b><br>%{x}<extra></extra>',
+                    showlegend=True,
+                )
+            )
+            continue
         for maintenance in maintenances_list:
             start_time = maintenance.time
             finish_time = start_time + timedelta(hours=maintenance.duration)
@@ -131,21 +312,32 @@ def generate_gantt_chart(initial_time, converters: list[Converter], maintenances
     no_label = False
     plot_all_info = True
 
-    for i, converter in enumerate(sorted(converters, key=lambda cv: cv.time)):
-        equation = ''
-        if plot_all_info and not no_label:
-            equation = "t<span style='font-size: 8px;'>{:01d}</span>: {:0d}min  ρ<span style='font-size: 8px;'>{:0d}</span>: {:.2f}".format(
-                i + 1, int((converter.time - initial_time).total_seconds() / 60), i + 1, converter.hmr
+    if scalable:
+        # one label trace instead of one annotation per converter, texts drawn only once zoomed in (LOD_SCRIPT)
+        sorted_converters = sorted(converters, key=lambda cv: cv.time)
+        fig_gantt.add_trace(lod_labels_trace(
+            x=[converter.time + (converter.end - converter.time) / 2 for converter in sorted_converters],
+            y=[converter_labels[int(converter.cv == 'cv_2')] for converter in sorted_converters],
+            text=["t{:01d}: {:0d}min ρ{:0d}: {:.2f}".format(
+                i + 1, int((converter.time - initial_time).total_seconds() / 60), i + 1, converter.hmr)
+                for i, converter in enumerate(sorted_converters)],
+        ))
+    else:
+        for i, converter in enumerate(sorted(converters, key=lambda cv: cv.time)):
+            equation = ''
+            if plot_all_info and not no_label:
+                equation = "t<span style='font-size: 8px;'>{:01d}</span>: {:0d}min  ρ<span style='font-size: 8px;'>{:0d}</span>: {:.2f}".format(
+                    i + 1, int((converter.time - initial_time).total_seconds() / 60), i + 1, converter.hmr
+                )
+            elif not plot_all_info and not no_label:
+                equation = round(converter.hmr,2)
+            fig_gantt.add_annotation(
+                x=converter.time + (converter.end - converter.time) / 2,
+                y=converter_labels[int(converter.cv == 'cv_2')],
+                text=equation,
+                showarrow=False,
+                font=dict(size=12, color="white" if converter.hmr < 0.96 else 'black'),
             )
-        elif not plot_all_info and not no_label:
-            equation = round(converter.hmr,2)
-        fig_gantt.add_annotation(
-            x=converter.time + (converter.end - converter.time) / 2,
-            y=converter_labels[int(converter.cv == 'cv_2')],
-            text=equation,
-            showarrow=False,
-            font=dict(size=12, color="white" if converter.hmr < 0.96 else 'black'),
-        )
 
     fig_gantt.update_layout(
         {
@@ -176,7 +368,7 @@ def generate_gantt_chart(initial_time, converters: list[Converter], maintenances
 
     # fig_gantt.show()
     return fig_gantt
-def plot_profit_per_iteration(profit_per_it):
+def plot_profit_per_iteration(profit_per_it, show=True):
     # Criar o gráfico de barras
     fig = go.Figure(data=go.Bar(x=list(profit_per_it.keys()), y=list(profit_per_it.values())))
 
@@ -188,17 +380,28 @@ def plot_profit_per_iteration(profit_per_it):
     )
 
     # Exibir o gráfico
-    fig.show()
+    if show:
+        fig.show()
     return fig
 
 
-def generate_pig_iron_balance_chart(pig_iron_balance: PigIronBalance, highlighted_datetimes: list[datetime]):
-    # Pig Iron Balance Data
-    saldo_de_gusa = [(state.time, round(state.value, 2)) for state in pig_iron_balance.pig_iron_balance]
-    saldo_de_gusa_map = {state.time: state.value for state in pig_iron_balance.pig_iron_balance}
-    # Create DataFrame for Pig Iron Balance data
-    df_saldo_gusa = pd.DataFrame({"Tempo": [item[0] for item in saldo_de_gusa],
-                                  "Saldo de Gusa": [item[1] for item in saldo_de_gusa]})
+def generate_pig_iron_balance_chart(pig_iron_balance: PigIronBalance, highlighted_datetimes: list[datetime],
+                                    scalable=False):
+    import pandas as pd
+
+    trace = pig_iron_balance.balance_trace
+    if scalable:
+        # straight from the trace arrays, min/max decimated to about one point per pixel column
+        keep = min_max_indices(trace.times, trace.values, DECIMATION_BUCKETS)
+        df_saldo_gusa = pd.DataFrame({"Tempo": trace.times[keep].astype('datetime64[us]'),
+                                      "Saldo de Gusa": np.round(trace.values[keep], 2)})
+    else:
+        # Pig Iron Balance Data
+        saldo_de_gusa = [(state.time, round(state.value, 2)) for state in pig_iron_balance.pig_iron_balance]
+        saldo_de_gusa_map = {state.time: state.value for state in pig_iron_balance.pig_iron_balance}
+        # Create DataFrame for Pig Iron Balance data
+        df_saldo_gusa = pd.DataFrame({"Tempo": [item[0] for item in saldo_de_gusa],
+                                      "Saldo de Gusa": [item[1] for item in saldo_de_gusa]})
 
     # Generate line plot for Pig Iron Balance
     fig_saldo_gusa = go.Figure()
@@ -209,7 +412,7 @@ def generate_pig_iron_balance_chart(pig_iron_balance: PigIronBalance, highlighte
     #title = title_no_profit if pig_iron_balance.profit == 0 else title_profit
     # Add line plot for Pig Iron Balance
     fig_saldo_gusa.add_trace(
-        go.Scatter(
+        (go.Scattergl if scalable else go.Scatter)(
             x=df_saldo_gusa["Tempo"],
             y=df_saldo_gusa["Saldo de Gusa"],
             mode="lines",
@@ -218,7 +421,27 @@ def generate_pig_iron_balance_chart(pig_iron_balance: PigIronBalance, highlighte
         )
     )
 
-    for spill in pig_iron_balance.spill_events:
+    if scalable:
+        # every spill drop in one trace, drops separated by gaps
+        spill_index = np.flatnonzero(trace.kinds == BalanceStateKind.SPILL)
+        drops = np.stack([spill_index, spill_index + 1], axis=1)
+        x_vals = np.full((len(spill_index), 3), np.datetime64('NaT'), dtype='datetime64[us]')
+        y_vals = np.full((len(spill_index), 3), np.nan)
+        x_vals[:, :2] = trace.times[drops].astype('datetime64[us]')
+        y_vals[:, :2] = trace.values[drops]
+        fig_saldo_gusa.add_trace(
+            go.Scattergl(
+                x=x_vals.ravel(),
+                y=y_vals.ravel(),
+                mode="lines",
+                name="Highlighted",
+                line=dict(color="red", width=5),
+                hoverinfo="none",
+                connectgaps=False,
+            )
+        )
+
+    for spill in ([] if scalable else pig_iron_balance.spill_events):
         x_vals = [spill.time, spill.time + timedelta(seconds=1)]
         y_vals = [saldo_de_gusa_map[x_vals[0]], saldo_de_gusa_map[x_vals[1]]]
 
@@ -235,7 +458,15 @@ def generate_pig_iron_balance_chart(pig_iron_balance: PigIronBalance, highlighte
 
     # Add labels to the points of the blue line
     show_state_values = True
-    if show_state_values:
+    if show_state_values and scalable:
+        fig_saldo_gusa.add_trace(lod_labels_trace(
+            x=df_saldo_gusa["Tempo"][1:].tolist(),
+            y=df_saldo_gusa["Saldo de Gusa"][1:],
+            text=df_saldo_gusa["Saldo de Gusa"][1:].tolist(),
+            marker=dict(color="#687a9e", size=4),
+            textposition="top right",
+        ))
+    elif show_state_values:
         fig_saldo_gusa.add_trace(
             go.Scatter(
                 x=df_saldo_gusa["Tempo"][1:],
@@ -268,7 +499,19 @@ def generate_pig_iron_balance_chart(pig_iron_balance: PigIronBalance, highlighte
     altura_parametrizavel = pig_iron_balance.pig_iron_constants.torpedo_car_volume
     instantes_basculamento = [spill.time for spill in pig_iron_balance.spill_events]
 
-    for instante in instantes_basculamento:
+    if scalable and instantes_basculamento:
+        fig_saldo_gusa.add_trace(
+            go.Bar(
+                x=instantes_basculamento,
+                y=[altura_parametrizavel] * len(instantes_basculamento),
+                name="Basculamento",
+                hovertemplate="Hour: %{x}<br>Value: 250",
+                marker=dict(color="red"),
+                width=timedelta(minutes=15).total_seconds() * 1000,
+            )
+        )
+
+    for instante in ([] if scalable else instantes_basculamento):
         fig_saldo_gusa.add_trace(
             go.Bar(
                 x=[instante],
@@ -0,0 +1,183 @@
+"""
+Content-addressed cache of solved balances.
+
+The key is a SHA-256 of the normalized input (converters sorted and parsed, maintenances sorted, every scalar that
+changes the result) and of ``OPTIMIZER_VERSION``, so two files describing the same schedule share one entry and
+an engine change invalidates every entry at once. Entries are binary snapshots (``model.snapshot``) stored as
+``<key>.pibsnap``; the file modification time is the LRU clock, which keeps the store shareable between the
+worker processes of the batch runner without any index file.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+
+from model.optimizers import OPTIMIZER_VERSION
+from model.pig_iron_balance import PigIronBalance
+from utils.columnar_loader import ColumnarInput, columnar_input, pig_iron_balance_from_columns
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+SUFFIX = '.pibsnap'
+
+
+def fingerprint(columns: ColumnarInput, engine: Optional[str] = None, simulation_mode: Optional[str] = None) -> str:
+    """
+    Args:
+        columns: parsed input, see ``columnar_input``
+        engine: optimizer engine, defaults to the one of the input
+        simulation_mode: defaults to the one of the input
+
+    Returns:
+        hex digest identifying the solved result
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        'optimizer_version': OPTIMIZER_VERSION,
+        'engine': engine or columns.optimizer_engine,
+        'simulation_mode': simulation_mode or columns.simulation_mode,
+        'initial_conditions': [str(columns.initial_time), columns.initial_value],
+        'pig_iron_hourly_production': columns.pig_iron_hourly_production,
+        'max_restrictive': columns.max_restrictive,
+        'allow_auto_spill_events': columns.allow_auto_spill_events,
+        'optimize_hmr': columns.optimize_hmr,
+        'cv': columns.converters.cv.tolist(),
+    }, sort_keys=True).encode())
+    digest.update(np.ascontiguousarray(columns.converters.microseconds, dtype='<i8').tobytes())
+    digest.update(np.ascontiguousarray(columns.converters.hmr, dtype='<f8').tobytes())
+    for cv in sorted(columns.maintenances):
+        times = columns.maintenances[cv]['times'].astype(np.int64)
+        order = np.lexsort((columns.maintenances[cv]['durations'], times))
+        digest.update(cv.encode())
+        digest.update(np.ascontiguousarray(times[order], dtype='<i8').tobytes())
+        digest.update(np.ascontiguousarray(columns.maintenances[cv]['durations'][order], dtype='<f8').tobytes())
+    return digest.hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    bytes_used: int = 0
+    entries: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self):
+        return (f'Cache: {self.hits} hits / {self.misses} misses ({self.hit_rate:.1%}) - '
+                f'{self.entries} entries, {self.bytes_used / 1024:.1f} KiB - {self.evictions} evicted')
+
+
+class ResultCache:
+    """
+    On-disk store of solved balances, bounded to ``max_bytes`` by evicting the least recently used entries.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        os.makedirs(directory, exist_ok=True)
+        self.refresh_usage()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def entries(self) -> list:
+        """
+        Returns:
+            (last use, size, path) of every entry, least recently used first
+        """
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(SUFFIX):
+                path = os.path.join(self.directory, filename)
+                with contextlib.suppress(FileNotFoundError):
+                    status = os.stat(path)
+                    entries.append((status.st_mtime_ns, status.st_size, path))
+        return sorted(entries)
+
+    def refresh_usage(self):
+        entries = self.entries()
+        self.stats.entries = len(entries)
+        self.stats.bytes_used = sum(size for _, size, _ in entries)
+
+    def get(self, key: str) -> Optional[PigIronBalance]:
+        """
+        Returns:
+            the cached balance, or None on a miss
+        """
+        path = self.path(key)
+        try:
+            # read, not mapped: another process may evict the file while the balance is still in use
+            pig_iron_balance = PigIronBalance.load_snapshot(path, mmap=False)
+        except (FileNotFoundError, ValueError):
+            self.stats.misses += 1
+            return None
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        self.stats.hits += 1
+        return pig_iron_balance
+
+    def put(self, key: str, pig_iron_balance: PigIronBalance):
+        # written aside and renamed, so concurrent readers never see a partial snapshot
+        descriptor, temporary_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        os.close(descriptor)
+        try:
+            pig_iron_balance.save_snapshot(temporary_path)
+            os.replace(temporary_path, self.path(key))
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temporary_path)
+        self.evict()
+
+    def evict(self):
+        entries = self.entries()
+        bytes_used = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if bytes_used <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+                self.stats.evictions += 1
+            bytes_used -= size
+            evicted += 1
+        self.stats.entries = len(entries) - evicted
+        self.stats.bytes_used = bytes_used
+
+    def clear(self):
+        for _, _, path in self.entries():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+        self.refresh_usage()
+
+    def solve(self, input_data: Union[dict, ColumnarInput], engine: Optional[str] = None,
+              simulation_mode: Optional[str] = None) -> PigIronBalance:
+        """
+        Builds and optimizes the balance of ``input_data``, or returns the cached result without simulating.
+
+        Args:
+            input_data: JSON-like dict, as read from a test case file, or its columnar form
+            engine: optimizer engine, defaults to the one of the input
+            simulation_mode: defaults to the one of the input
+
+        Returns:
+
+        """
+        columns = input_data if isinstance(input_data, ColumnarInput) else columnar_input(input_data)
+        key = fingerprint(columns, engine, simulation_mode)
+        pig_iron_balance = self.get(key)
+        if pig_iron_balance is None:
+            pig_iron_balance = pig_iron_balance_from_columns(columns, simulation_mode=simulation_mode)
+            pig_iron_balance.optimize_hmr(engine=engine)
+            self.put(key, pig_iron_balance)
+        return pig_iron_balance